@@ -0,0 +1,114 @@
+"""Measure the round-trip latency of handing a command to the bot loop.
+
+A "bot" thread waits in `select` on the command queue the same way
+`IrcpdbBot.process_forever` does, and acknowledges each command it
+receives through a second queue of the same kind; we time how long each
+command takes to make the round trip.
+
+Usage (from the repository root)::
+
+    PYTHONPATH=. python benchmarks/command_channel.py [ITERATIONS]
+
+"""
+from __future__ import print_function
+
+import select
+import sys
+import threading
+import time
+
+from ircpdb.channel import CommandChannel
+
+
+# Objects put into a `multiprocessing.Queue` are pickled, so the sentinel
+# has to survive a round trip through pickle.
+STOP = 'STOP'
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100.0), len(values) - 1)]
+
+
+def mp_queue_loop(commands, replies):
+    # This is how the bot loop consumed `multiprocessing.Queue` prior to
+    # switching to `CommandChannel`.
+    while True:
+        select.select([commands._reader], [], [])
+        while not commands.empty():
+            command = commands.get(block=False)
+            if command == STOP:
+                return
+            replies.put(command)
+
+
+def channel_loop(commands, replies):
+    while True:
+        select.select([commands], [], [])
+        for command in commands.drain():
+            if command == STOP:
+                return
+            replies.put(command)
+
+
+def wait_mp_queue(replies):
+    return replies.get()
+
+
+def wait_channel(replies):
+    while True:
+        select.select([replies], [], [])
+        items = replies.drain()
+        if items:
+            return items[0]
+
+
+def run(name, create, loop, wait, iterations):
+    started = time.time()
+    commands, replies = create(), create()
+    setup = time.time() - started
+
+    bot = threading.Thread(target=loop, args=(commands, replies))
+    bot.daemon = True
+    bot.start()
+
+    timings = []
+    for i in range(iterations):
+        started = time.time()
+        commands.put('p %s' % i)
+        wait(replies)
+        timings.append(time.time() - started)
+    commands.put(STOP)
+    bot.join()
+
+    print(
+        '%-24s setup %8.3f ms   mean %8.1f us   p50 %8.1f us   '
+        'p99 %8.1f us' % (
+            name,
+            setup * 1000,
+            sum(timings) / len(timings) * 1e6,
+            percentile(timings, 50) * 1e6,
+            percentile(timings, 99) * 1e6,
+        )
+    )
+
+
+def main(iterations=2000):
+    started = time.time()
+    from multiprocessing import Queue
+    print(
+        'import multiprocessing: %.3f ms' % ((time.time() - started) * 1000)
+    )
+
+    run(
+        'multiprocessing.Queue', Queue, mp_queue_loop, wait_mp_queue,
+        iterations
+    )
+    run(
+        'CommandChannel', CommandChannel, channel_loop, wait_channel,
+        iterations
+    )
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,44 @@
+"""Measure what a conditional breakpoint that doesn't fire costs per call.
+
+Each scenario calls `ircpdb.set_trace` with conditions that never let
+the breakpoint fire, and is compared against calling a function that
+does nothing at all.
+
+Usage (from the repository root)::
+
+    PYTHONPATH=. python benchmarks/conditional.py [ITERATIONS]
+
+"""
+from __future__ import print_function
+
+import sys
+import timeit
+
+import ircpdb
+
+
+def noop(*args, **kwargs):
+    pass
+
+
+SCENARIOS = [
+    ('empty function call', lambda: noop(when=False)),
+    ('when=False', lambda: ircpdb.set_trace(when=False)),
+    ('when=<callable>', lambda: ircpdb.set_trace(when=lambda: False)),
+    ('sample_rate=0', lambda: ircpdb.set_trace(sample_rate=0)),
+    ('max_hits=0', lambda: ircpdb.set_trace(max_hits=0)),
+    (
+        'cooldown, max_hits, when',
+        lambda: ircpdb.set_trace(cooldown=60, max_hits=1, when=False)
+    ),
+]
+
+
+def main(iterations=200000):
+    for name, func in SCENARIOS:
+        best = min(timeit.repeat(func, number=iterations, repeat=5))
+        print('%-28s %8.3f us/call' % (name, best / iterations * 1e6))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,188 @@
+"""A local stand-in for an IRC server used by the benchmarks.
+
+It understands just enough of the protocol for ircpdb to connect, join
+a channel and talk in it, and keeps count of what it's sent.  Like most
+real servers, it disconnects clients sending messages faster than its
+flood limits allow: each client may send `flood_burst` messages at once,
+and `flood_rate` messages per second after that.  A message may be sent
+to up to `max_targets` channels at once.  If `multiline` is set, the
+server offers the IRCv3 capabilities needed for sending multiline
+messages, each of which counts as a single message towards the limits.
+
+Messages can be sent to a channel on behalf of a (non-existent) user
+using `say`, and every message sent to a channel is handed to the
+`on_message` callback, so a benchmark can script a conversation with
+the debugger.
+"""
+import threading
+import time
+
+from six.moves.socketserver import StreamRequestHandler, TCPServer
+from six.moves.socketserver import ThreadingMixIn
+
+
+class FakeIrcHandler(StreamRequestHandler):
+    def setup(self):
+        StreamRequestHandler.setup(self)
+        self.nickname = None
+        self.channels = set()
+        self.lock = threading.Lock()
+        # When this client's flood allowance will be fully restored.
+        self.flood_clock = time.time()
+        # Registration is held until capability negotiation ends.
+        self.negotiating = False
+        self.registered = False
+
+    def send(self, line):
+        with self.lock:
+            try:
+                self.wfile.write(line.encode('utf-8') + b'\r\n')
+                self.wfile.flush()
+            except (IOError, OSError, ValueError):
+                pass
+
+    def get_prefix(self):
+        return '%s!bot@fake.example.com' % self.nickname
+
+    def handle(self):
+        server = self.server
+        for raw in self.rfile:
+            with server.lock:
+                server.bytes_received += len(raw)
+                server.lines_received += 1
+            line = raw.decode('utf-8', 'replace').rstrip('\r\n')
+            tags = ''
+            if line.startswith('@'):
+                tags, _, line = line.partition(' ')
+            batched = 'batch=' in tags or line.startswith('BATCH -')
+            if not batched and self.is_flooding():
+                with server.lock:
+                    server.flood_disconnects += 1
+                self.send('ERROR :Closing Link: %s (Excess Flood)' % (
+                    self.nickname
+                ))
+                return
+            command, _, rest = line.partition(' ')
+            handler = getattr(self, 'do_%s' % command.upper(), None)
+            if handler is not None:
+                if handler(rest) is False:
+                    return
+
+    def is_flooding(self):
+        if self.nickname is None or not self.server.flood_rate:
+            return False
+        now = time.time()
+        self.flood_clock = max(self.flood_clock, now) + (
+            1.0 / self.server.flood_rate
+        )
+        return self.flood_clock - now > (
+            float(self.server.flood_burst) / self.server.flood_rate
+        )
+
+    def do_NICK(self, rest):
+        self.nickname = rest.strip().lstrip(':')
+
+    def do_CAP(self, rest):
+        if not self.server.multiline:
+            self.send(':fake.example.com 421 * CAP :Unknown command')
+            return
+        subcommand, _, caps = rest.partition(' ')
+        if subcommand == 'LS':
+            self.negotiating = True
+            self.send(
+                ':fake.example.com CAP * LS :batch message-tags '
+                'draft/multiline=max-bytes=4096,max-lines=100'
+            )
+        elif subcommand == 'REQ':
+            self.send(':fake.example.com CAP * ACK %s' % caps)
+        elif subcommand == 'END':
+            self.negotiating = False
+            if self.registered:
+                self.welcome()
+
+    def do_USER(self, rest):
+        self.registered = True
+        if not self.negotiating:
+            self.welcome()
+
+    def welcome(self):
+        self.send(':fake.example.com 001 %s :Welcome' % self.nickname)
+        self.send(
+            ':fake.example.com 005 %s TARGMAX=PRIVMSG:%s '
+            ':are supported by this server' % (
+                self.nickname, self.server.max_targets
+            )
+        )
+
+    def do_PING(self, rest):
+        self.send(':fake.example.com PONG fake.example.com %s' % rest)
+
+    def do_JOIN(self, rest):
+        for channel in rest.split()[0].split(','):
+            self.channels.add(channel)
+            with self.server.lock:
+                self.server.members.setdefault(channel, set()).add(self)
+            self.send(':%s JOIN %s' % (self.get_prefix(), channel))
+
+    def do_PRIVMSG(self, rest):
+        targets, _, text = rest.partition(' :')
+        for target in targets.split(','):
+            with self.server.lock:
+                self.server.messages.append((time.time(), target, text, ))
+            if self.server.on_message is not None:
+                self.server.on_message(target, text)
+
+    def do_QUIT(self, rest):
+        return False
+
+    def finish(self):
+        with self.server.lock:
+            for channel in self.channels:
+                self.server.members.get(channel, set()).discard(self)
+        StreamRequestHandler.finish(self)
+
+
+class FakeIrcServer(ThreadingMixIn, TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+        self, address=('127.0.0.1', 0), flood_burst=10, flood_rate=2.0,
+        max_targets=4, multiline=False, on_message=None
+    ):
+        TCPServer.__init__(self, address, FakeIrcHandler)
+        self.lock = threading.Lock()
+        self.flood_burst = flood_burst
+        self.flood_rate = flood_rate
+        self.max_targets = max_targets
+        self.multiline = multiline
+        self.on_message = on_message
+        self.members = {}
+        self.messages = []
+        self.bytes_received = 0
+        self.lines_received = 0
+        self.flood_disconnects = 0
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def say(self, channel, text, nickname='tester'):
+        with self.lock:
+            members = list(self.members.get(channel, ()))
+        for member in members:
+            member.send(
+                ':%s!user@fake.example.com PRIVMSG %s :%s' % (
+                    nickname, channel, text
+                )
+            )
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,72 @@
+"""Count the connections opened to the pastebin during a session.
+
+Pastes a handful of responses to a local stub of the Gist API, first the
+way `GistBackend` did prior to keeping a session open (one
+`requests.post` per paste), and then using `GistBackend` itself.  Every
+connection counted here would be a full TCP+TLS handshake against
+api.github.com.
+
+Usage (from the repository root)::
+
+    PYTHONPATH=.:benchmarks python benchmarks/paste_connections.py [PASTES]
+
+"""
+from __future__ import print_function
+
+import json
+import sys
+import time
+
+import requests
+
+from ircpdb.paste_backends import GistBackend
+from stub_paste_server import StubPasteServer
+
+
+def paste_without_session(url, lines):
+    response = requests.post(
+        url,
+        data=json.dumps(
+            {'files': {'output.txt': {'content': '\n'.join(lines)}}}
+        ),
+    )
+    return response.json()['html_url']
+
+
+def run(name, paste, pastes):
+    server = StubPasteServer().start()
+    lines = ['line %s' % i for i in range(40)]
+    try:
+        started = time.time()
+        for _ in range(pastes):
+            paste(server.url, lines)
+        elapsed = time.time() - started
+        print(
+            '%-20s %3s pastes  %3s connections  %7.2f ms/paste' % (
+                name,
+                server.requests,
+                server.connections,
+                elapsed / pastes * 1000,
+            )
+        )
+    finally:
+        server.stop()
+
+
+def main(pastes=20):
+    run('requests.post', paste_without_session, pastes)
+
+    backends = {}
+
+    def paste_with_backend(url, lines):
+        if url not in backends:
+            backends[url] = GistBackend(url=url)
+        return backends[url].paste(lines)
+
+    run('GistBackend', paste_with_backend, pastes)
+    for backend in backends.values():
+        backend.close()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,170 @@
+"""Drive complete debugging sessions against local stand-in servers.
+
+Each scenario hits `ircpdb.set_trace` in a small program, connected to
+a `FakeIrcServer` (enforcing flood limits, as real servers do) and, for
+pasting, a `StubPasteServer`.  A scripted user sends each of the
+scenario's commands as soon as the debugger says it's ready, and we
+report:
+
+* time to ready: from calling `set_trace` until the first prompt.
+* command round trip: from sending a command until the next prompt.
+* lines per second delivered to the channel, and bytes sent to the
+  IRC server.
+* flood disconnects, which should always be zero.
+* the peak RSS of this process so far.
+
+Usage (from the repository root)::
+
+    PYTHONPATH=.:benchmarks python benchmarks/sessions.py [SCENARIO...]
+
+"""
+from __future__ import print_function
+
+import resource
+import sys
+import threading
+import time
+
+import ircpdb
+from fake_irc_server import FakeIrcServer
+from stub_paste_server import StubPasteServer
+
+
+CHANNEL = '#benchmark'
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100.0), len(values) - 1)]
+
+
+def program(**kwargs):
+    data = dict(('key%03d' % i, 'value ' * 8) for i in range(40))
+    total = 0
+    ircpdb.set_trace(**kwargs)
+    for i in range(1000):
+        total += i
+        data['key000'] = total
+    return total
+
+
+class ScriptedUser(object):
+    """Sends each command once the debugger says it's ready."""
+    def __init__(self, server, commands):
+        self.server = server
+        self.commands = list(commands)
+        self.sent = None
+        self.first_ready = None
+        self.round_trips = []
+
+    def on_message(self, target, text):
+        if text != '\001ACTION ready\001':
+            return
+        now = time.time()
+        if self.first_ready is None:
+            self.first_ready = now
+        if self.sent is not None:
+            self.round_trips.append(now - self.sent)
+        if not self.commands:
+            return
+        self.sent = time.time()
+        self.server.say(CHANNEL, '!' + self.commands.pop(0))
+
+
+SCENARIOS = {
+    # Stepping through a loop, one short response per command.
+    'step': {
+        'commands': ['n'] * 20,
+        'params': {},
+    },
+    # Displaying a large value over IRC, throttled as the defaults are.
+    'bulk': {
+        'commands': ['pp data', 'pp data'],
+        'params': {'paste_minimum_response_length': 100000},
+    },
+    # As above, with as many lines packed into each message as will fit.
+    'packed': {
+        'commands': ['pp data', 'pp data'],
+        'params': {
+            'paste_minimum_response_length': 100000,
+            'pack_lines': True,
+        },
+    },
+    # As above, sending each response as a single multiline message.
+    'multiline': {
+        'commands': ['pp data', 'pp data'],
+        'params': {'paste_minimum_response_length': 100000},
+        'server': {'multiline': True},
+    },
+    # Displaying large values via the pastebin.
+    'paste': {
+        'commands': ['pp data', 'p data', 'pp data'],
+        'params': {'paste_minimum_response_length': 20},
+    },
+    # Running several commands per message.
+    'batch': {
+        'commands': ['n; n; p total'] * 4,
+        'params': {},
+    },
+}
+
+
+def run(name, scenario, timeout=300):
+    irc_server = FakeIrcServer(**scenario.get('server', {})).start()
+    paste_server = StubPasteServer().start()
+    user = ScriptedUser(irc_server, scenario['commands'] + ['c'])
+    irc_server.on_message = user.on_message
+
+    params = {
+        'server': '127.0.0.1',
+        'port': irc_server.port,
+        'ssl': False,
+        'channel': CHANNEL,
+        'nickname': 'debugger',
+        'limit_access_to': ['tester'],
+        'paste_url': paste_server.url,
+        'paste_cache_size': 0,
+    }
+    params.update(scenario['params'])
+
+    started = time.time()
+    thread = threading.Thread(target=program, kwargs=params)
+    thread.daemon = True
+    thread.start()
+    thread.join(timeout)
+    elapsed = time.time() - started
+
+    with irc_server.lock:
+        lines = len([
+            message for message in irc_server.messages
+            if message[1] == CHANNEL
+        ])
+    try:
+        print(
+            '%-9s ready %6.3f s   round trip p50 %7.3f s p99 %7.3f s   '
+            '%7.1f lines/s   %8s bytes   %s flood disconnects   '
+            '%s pastes   peak RSS %s KiB%s' % (
+                name,
+                user.first_ready - started,
+                percentile(user.round_trips, 50),
+                percentile(user.round_trips, 99),
+                lines / (elapsed - (user.first_ready - started)),
+                irc_server.bytes_received,
+                irc_server.flood_disconnects,
+                paste_server.requests,
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                '   (timed out)' if thread.is_alive() else '',
+            )
+        )
+    finally:
+        irc_server.stop()
+        paste_server.stop()
+
+
+def main(*names):
+    for name in names or sorted(SCENARIOS):
+        run(name, SCENARIOS[name])
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,86 @@
+"""A local stand-in for the Gist API used by the benchmarks.
+
+It accepts ``POST`` requests on any path, responds the way the Gist API
+does (a JSON document having an ``html_url``), and keeps count of the
+requests and TCP connections it has handled.
+"""
+import json
+import threading
+
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
+
+
+class StubPasteHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = self.read_chunked()
+        else:
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.bytes_received += len(body)
+            paste_id = self.server.requests
+        if self.server.delay:
+            threading.Event().wait(self.server.delay)
+
+        response = json.dumps({
+            'html_url': 'http://%s:%s/%s' % (
+                self.server.server_address[0],
+                self.server.server_address[1],
+                paste_id,
+            )
+        }).encode('utf-8')
+        self.send_response(201)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def read_chunked(self):
+        body = []
+        while True:
+            size = int(self.rfile.readline().strip(), 16)
+            if not size:
+                self.rfile.readline()
+                break
+            body.append(self.rfile.read(size))
+            self.rfile.readline()
+        return b''.join(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubPasteServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), delay=0):
+        HTTPServer.__init__(self, address, StubPasteHandler)
+        self.lock = threading.Lock()
+        self.delay = delay
+        self.connections = 0
+        self.requests = 0
+        self.bytes_received = 0
+
+    @property
+    def url(self):
+        return 'http://%s:%s/gists' % self.server_address
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -8,4 +8,23 @@ __author__ = "Adam Coddington <me@adamcoddington.net>"
 __version__ = "1.8.1"
 
 
-from .debugger import set_trace
+import logging
+import os
+
+from .debugger import set_trace, warm
+from .exceptions import IrcpdbError
+from .utils import boolean
+
+
+if (
+    boolean(os.environ.get('IRCPDB_WARM', '')) and
+    'DEFAULT_IRCPDB_URI' in os.environ
+):
+    # Connecting early is only an optimisation; it mustn't stop
+    # `ircpdb` from being imported.
+    try:
+        warm()
+    except (IrcpdbError, ValueError) as e:
+        logging.getLogger(__name__).warning(
+            'Unable to connect to IRC ahead of time: %s', e
+        )
@@ -0,0 +1,93 @@
+import re
+
+
+# pdb reports errors with lines like these; an exception raised by the
+# program being debugged is displayed as its type, e.g. "ValueError: ...".
+ERROR_PATTERN = re.compile(
+    r'^(\*\*\* |Traceback \(most recent call last\)|'
+    r'[\w.]*(Error|Exception)(: |$))',
+    re.MULTILINE,
+)
+
+
+def split_commands(line, separator=';'):
+    """Split `line` into commands at each `separator` not within quotes.
+
+    A separator preceded by a backslash (outside of quotes) is kept as
+    part of the command, without the backslash.
+    """
+    commands = []
+    current = []
+    quote = None
+    escaped = False
+    for char in line:
+        if escaped:
+            escaped = False
+            if quote is None and char == separator:
+                current.pop()
+        elif char == '\\':
+            escaped = True
+        elif quote is not None:
+            if char == quote:
+                quote = None
+        elif char in ('"', "'"):
+            quote = char
+        elif char == separator:
+            commands.append(''.join(current).strip())
+            current = []
+            continue
+        current.append(char)
+    commands.append(''.join(current).strip())
+    return [command for command in commands if command]
+
+
+class Batch(object):
+    """Several commands to be sent to pdb one after another.
+
+    Each command is sent as soon as pdb has finished responding to the
+    previous one, and the responses are collected so that they can be
+    sent to IRC together, each headed by the command it answers.  If
+    `abort_on_error` is set, commands following one whose response looks
+    like an error are skipped.
+    """
+    def __init__(self, commands, abort_on_error=True):
+        self.commands = list(commands)
+        self.abort_on_error = abort_on_error
+        self.index = 0
+        self.output = []
+        self.lines = []
+        self.aborted = False
+
+    def get_next_command(self):
+        """Returns the next command to send, or `None` if we're finished."""
+        if self.aborted or self.index >= len(self.commands):
+            return None
+        command = self.commands[self.index]
+        self.index += 1
+        self.lines.append(u'(Pdb) %s' % command)
+        return command
+
+    def add_output(self, text, complete):
+        """Collect pdb's output for the command most recently sent."""
+        self.output.append(text)
+        if not complete:
+            return
+        response = u''.join(self.output).strip()
+        self.output = []
+        if response:
+            self.lines.extend(response.split('\n'))
+        if self.abort_on_error and ERROR_PATTERN.search(response):
+            skipped = len(self.commands) - self.index
+            if skipped:
+                self.aborted = True
+                self.lines.append(
+                    u'(skipped %s remaining commands after an error)' % (
+                        skipped
+                    )
+                )
+
+    def get_lines(self):
+        lines = list(self.lines)
+        if self.output:
+            lines.extend(u''.join(self.output).strip().split('\n'))
+        return lines
@@ -1,17 +1,40 @@
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import difflib
 import fcntl
+import functools
 import logging
-from multiprocessing import Queue
+import math
 import os
 import random
+import re
+import select
 import socket
 import textwrap
+import threading
 import time
 
-from irc import strings
+from irc import schedule, strings
 from irc.bot import SingleServerIRCBot, ServerSpec
+from irc.client import is_channel, Reactor
+from irc.dict import IRCDict
 import six
 
+from .batch import Batch, split_commands
+from .channel import CommandChannel
 from .exceptions import PasteError
+from .flood import (
+    AdaptiveRate, DEFAULT_PROFILE_PATH, FloodProfiles, LagMonitor,
+)
+from .macros import DEFAULT_MACRO_PATH, MacroStore
+from .metrics import (
+    BYTES_BUCKETS, Counter, DEPTH_BUCKETS, Gauge, Histogram, Metrics,
+)
+from .pager import OutputPager
+from .paste_cache import PasteCache
+from .reader import FrameReader
+from .throttle import Backoff, TokenBucket
+from .utils import get_byte_length, split_utf8
 
 
 logger = logging.getLogger(__name__)
@@ -19,6 +42,35 @@ logger = logging.getLogger(__name__)
 
 class IrcpdbBot(SingleServerIRCBot):
     PROMPT = 'ready'
+    # RFC 2812 limits messages to 512 bytes including the trailing CR/LF.
+    MAX_MESSAGE_BYTES = 512
+    # Used for estimating the length of the `nick!user@host` prefix that
+    # the server prepends when relaying our messages until we've seen
+    # our real hostmask echoed back to us.
+    MAX_USERNAME_LENGTH = 10
+    MAX_HOSTNAME_LENGTH = 63
+    PACK_DELIMITER = u' \u21b5 '
+    # Commands whose output describes where the debugger now is rather
+    # than the state of anything; it's never diffed.
+    UNDIFFED_COMMANDS = set([
+        'n', 'next', 's', 'step', 'r', 'return', 'c', 'cont', 'continue',
+        'unt', 'until', 'j', 'jump', 'u', 'up', 'd', 'down', 'l', 'list',
+        'more',
+    ])
+    MAX_DIFFED_COMMANDS = 100
+    # Messages waiting longer than this to be sent are considered to
+    # have been held back by the throttle.
+    THROTTLED_SECONDS = 0.01
+    # Whether `!n; n; p x` should be run as a batch of three commands.
+    SUPPORTS_BATCHES = True
+    # The IRCv3 capabilities we request if the server offers them; they
+    # let us send several lines of output as a single message.
+    WANTED_CAPS = ('batch', 'message-tags', 'draft/multiline', )
+    # Batch IDs are kept shorter than this so that the ``@batch=ID ``
+    # tag can be accounted for in each message's budget.
+    MAX_BATCH_ID_LENGTH = 8
+    # Used if the server doesn't say how long a multiline message may be.
+    DEFAULT_MULTILINE_BYTES = 4096
 
     def __init__(
         self, channel, nickname, server, port, password,
@@ -26,16 +78,152 @@ class IrcpdbBot(SingleServerIRCBot):
         paste_minimum_response_length,
         activation_timeout,
         paste_backend=None,
+        message_burst=5,
+        pack_lines=False,
+        paste_timeout=10,
+        paste_workers=2,
+        paste_cache_size=128,
+        paste_cache_ttl=3600,
+        paste_cache_path=None,
+        max_response_bytes=1048576,
+        pager_lines=0,
+        pager_buffer_lines=1000,
+        diff_mode=False,
+        abort_batch_on_error=True,
+        macro_path=DEFAULT_MACRO_PATH,
+        metrics_path=None,
+        metrics_interval=60,
+        adaptive_flood_control=False,
+        flood_profile_path=DEFAULT_PROFILE_PATH,
+        lag_check_seconds=15,
+        reconnect_min_seconds=1,
+        reconnect_max_seconds=60,
+        reconnect_deadline=300,
+        reconnect_buffer_messages=100,
+        mirror_channels=None,
+        multiline=True,
         **connect_params
     ):
         self.channel = channel
-        self.queue = Queue()
+        # Everything sent to `channel` is sent to these, too.
+        self.mirror_channels = list(mirror_channels or [])
+        self.hostmask = None
+        self.pack_lines = pack_lines
+        self.queue = CommandChannel()
         self.joined = False
         self.activated = False
-        self.pre_join_queue = []
+        # Whether pdb's pipes have been handed to us yet; a pre-warmed
+        # bot connects and joins its channel before there's a debugger
+        # to relay.
+        self.attached = False
+        # Set once we've joined our channel; `time_to_ready` is the
+        # number of seconds that took after we started connecting.
+        self.ready = threading.Event()
+        self.connect_started = None
+        self.time_to_ready = None
+        # Messages sent before we've joined our channel, or while we're
+        # disconnected; only the most recent are kept.
+        self.pre_join_queue = deque(maxlen=reconnect_buffer_messages)
+        self.pre_join_dropped = 0
+        # If the connection is lost, we try to reconnect after waiting
+        # longer and longer; if we're still disconnected after
+        # `reconnect_deadline` seconds, pdb is told to continue so that
+        # the program being debugged isn't stuck waiting forever.
+        self.reconnect_backoff = Backoff(
+            reconnect_min_seconds, reconnect_max_seconds
+        )
+        self.reconnect_deadline = reconnect_deadline
+        self.disconnected_at = None
+        self.quitting = False
+        self.greeted = False
+        # Outgoing PRIVMSGs are queued here and drained from a reactor
+        # timer as tokens become available in `self.bucket`.
+        self.outbox = deque()
+        self.drain_scheduled = False
+        self.running = False
+        # Set once we're on our way out, and once everything has been
+        # sent and we've disconnected.
+        self.closing = False
+        self.closed = threading.Event()
+        # File objects watched by the bot's loop, and the function to
+        # call when each becomes readable.
+        self.readers = {}
+        self.outhandle = None
+        self.bucket = TokenBucket(
+            self.get_message_rate(message_wait_seconds),
+            message_burst,
+        )
         self.message_wait_seconds = message_wait_seconds
         self.paste_minimum_response_length = paste_minimum_response_length
         self.paste_backend = paste_backend
+        self.paste_timeout = paste_timeout
+        self.max_response_bytes = max_response_bytes
+        # If set, only the first few lines of each of pdb's responses
+        # are sent; the rest are kept here until somebody asks for them.
+        self.pager = None
+        if pager_lines:
+            self.pager = OutputPager(pager_lines, pager_buffer_lines)
+        # Commands sent to pdb whose responses haven't arrived yet; pdb
+        # answers them in order, so each response belongs to the oldest.
+        self.pending_commands = deque()
+        self.last_command = None
+        # If set, responses to repeated commands are sent as diffs
+        # against the previous response to the same command.
+        self.diff_mode = diff_mode
+        self.last_responses = OrderedDict()
+        self.last_full_response = None
+        self.response_partial = False
+        # The batch of commands currently being fed to pdb, if any.
+        self.batch = None
+        self.abort_batch_on_error = abort_batch_on_error
+        self.macros = MacroStore(macro_path)
+        # The name of the macro being recorded and the commands recorded
+        # for it so far.
+        self.recording = None
+        self.metrics = Metrics(self.get_metric_definitions())
+        self.metrics_path = metrics_path
+        self.metrics_interval = metrics_interval
+        # If enabled, the rate at which messages are sent is adjusted to
+        # whatever the server turns out to tolerate.
+        self.flood_control = None
+        self.lag_monitor = None
+        self.lag_check_seconds = lag_check_seconds
+        self.server_key = '%s:%s' % (server, port)
+        if adaptive_flood_control:
+            self.flood_profiles = FloodProfiles(flood_profile_path)
+            profile = self.flood_profiles.get(self.server_key) or {}
+            self.flood_control = AdaptiveRate(
+                profile.get('rate') or self.bucket.rate or 1,
+                profile.get('burst') or message_burst,
+                max_burst=message_burst,
+            )
+            self.lag_monitor = LagMonitor()
+            self.apply_flood_control()
+        self.paste_workers = paste_workers
+        self.paste_executor = None
+        self.pending_pastes = set()
+        self.paste_cache = None
+        if paste_cache_size:
+            self.paste_cache = PasteCache(
+                size=paste_cache_size,
+                ttl=paste_cache_ttl,
+                path=paste_cache_path,
+            )
+        # Functions that other threads would like to have run on the
+        # bot's thread (e.g. when a paste upload completes).
+        self.callbacks = CommandChannel()
+        # If enabled, we ask the server which IRCv3 capabilities it
+        # offers as soon as we've connected; `multiline_limits` is set
+        # to the most bytes and lines a multiline batch may hold if it
+        # agrees to let us send them.
+        self.multiline = multiline
+        self.offered_caps = {}
+        self.caps = set()
+        self.multiline_limits = None
+        self.next_batch_id = 0
+        self.reactor_class = functools.partial(
+            Reactor, on_connect=self.on_socket_connect
+        )
         self.activation_timeout = activation_timeout
         self.limit_access_to = limit_access_to
         server = ServerSpec(server, port, password)
@@ -43,6 +231,188 @@ class IrcpdbBot(SingleServerIRCBot):
             [server], nickname, nickname, **connect_params
         )
 
+    def get_metric_definitions(self):
+        return [
+            ('pdb_read_bytes', Histogram(
+                'Bytes of output read from pdb at a time.', BYTES_BUCKETS
+            )),
+            ('pdb_commands', Counter('Commands sent to pdb.')),
+            ('pdb_command_seconds', Histogram(
+                'Seconds between sending pdb a command and its prompt.'
+            )),
+            ('irc_messages_sent', Counter('Messages sent to IRC.')),
+            ('irc_outbox_depth', Histogram(
+                'Messages waiting to be sent to IRC after queueing more.',
+                DEPTH_BUCKETS,
+            )),
+            ('irc_throttle_wait_seconds', Histogram(
+                'Seconds messages waited for the flood-control throttle.'
+            )),
+            ('paste_seconds', Histogram('Seconds taken to upload pastes.')),
+            ('paste_failures', Counter('Pastes that failed.')),
+            ('paste_timeouts', Counter(
+                'Pastes abandoned for taking longer than paste_timeout.'
+            )),
+            ('paste_cache_hits', Counter(
+                'Pastes answered using the URL of an earlier paste.'
+            )),
+            ('loop_iteration_seconds', Histogram(
+                "Seconds spent handling events per iteration of the bot's "
+                "loop."
+            )),
+            ('irc_send_rate', Gauge(
+                'Messages per second sent to IRC after the initial burst.'
+            )),
+            ('irc_lag_seconds', Gauge(
+                'Round-trip time of the last PING sent to the server.'
+            )),
+            ('flood_penalties', Counter(
+                'Times the server disconnected us for flooding or lagged '
+                'behind our messages.'
+            )),
+            ('irc_reconnects', Counter(
+                'Times the connection to IRC was lost and re-established.'
+            )),
+            ('time_to_ready_seconds', Gauge(
+                'Seconds between starting to connect and joining the '
+                'channel.'
+            )),
+        ]
+
+    @property
+    def message_wait_seconds(self):
+        return self._message_wait_seconds
+
+    @message_wait_seconds.setter
+    def message_wait_seconds(self, value):
+        if not value >= 0 or math.isinf(value):
+            raise ValueError(
+                'message_wait_seconds must be zero or a positive number, '
+                'not %r' % value
+            )
+        self._message_wait_seconds = value
+        self.bucket.set_rate(self.get_message_rate(value))
+        if getattr(self, 'flood_control', None) is not None:
+            # Learn from here on.
+            self.flood_control.rate = self.flood_control.clamp(
+                self.bucket.rate or self.flood_control.max_rate
+            )
+            self.apply_flood_control()
+
+    def get_message_rate(self, message_wait_seconds):
+        if not message_wait_seconds:
+            return 0
+        return 1.0 / message_wait_seconds
+
+    def apply_flood_control(self):
+        self.bucket.set_rate(self.flood_control.rate)
+        self.bucket.set_burst(self.flood_control.burst)
+        self.metrics.set('irc_send_rate', self.flood_control.rate)
+
+    def save_flood_profile(self):
+        self.flood_profiles.set(
+            self.server_key,
+            self.flood_control.rate,
+            self.flood_control.burst,
+        )
+
+    def on_flood_penalty(self, reason):
+        self.metrics.increment('flood_penalties')
+        if self.flood_control is None:
+            return
+        self.flood_control.on_penalty()
+        logger.warning(
+            '%s; sending at most %.2f messages per second (after a burst '
+            'of %s) from now on.',
+            reason,
+            self.flood_control.rate,
+            self.flood_control.burst,
+        )
+        self.apply_flood_control()
+        self.save_flood_profile()
+
+    def on_error(self, c, e):
+        self.check_for_flood_notice(e)
+
+    def on_kill(self, c, e):
+        self.check_for_flood_notice(e)
+
+    def check_for_flood_notice(self, e):
+        text = ' '.join([e.target or ''] + list(e.arguments))
+        if 'flood' in text.lower():
+            self.on_flood_penalty('Disconnected for flooding (%s)' % text)
+
+    def check_lag(self):
+        if not self.connection.is_connected():
+            return
+        self.lag_token = getattr(self, 'lag_token', 0) + 1
+        token = 'ircpdb-%s' % self.lag_token
+        self.lag_monitor.start(token)
+        self.connection.ping(token)
+
+    def on_pong(self, c, e):
+        if self.lag_monitor is None:
+            return
+        token = e.arguments[-1] if e.arguments else e.target
+        lagging = self.lag_monitor.finish(token)
+        if self.lag_monitor.last is not None:
+            self.metrics.set('irc_lag_seconds', self.lag_monitor.last)
+        # Lag while we're not sending anything isn't our doing.
+        if lagging and self.outbox:
+            self.on_flood_penalty(
+                'Server lag rose to %.2f seconds' % self.lag_monitor.last
+            )
+
+    def on_socket_connect(self, sock):
+        self.offered_caps = {}
+        self.caps = set()
+        self.multiline_limits = None
+        if self.multiline:
+            # Servers supporting capability negotiation hold off on
+            # registering us until we've finished; others just reply
+            # that they don't know the command.
+            self.connection.cap('LS', '302')
+
+    def on_cap(self, c, e):
+        subcommand = e.arguments[0]
+        if subcommand == 'LS':
+            for cap in e.arguments[-1].split():
+                name, _, value = cap.partition('=')
+                self.offered_caps[name] = value
+            if len(e.arguments) > 2 and e.arguments[1] == '*':
+                # The rest of the list is on its way.
+                return
+            wanted = [
+                cap for cap in self.WANTED_CAPS if cap in self.offered_caps
+            ]
+            if len(wanted) == len(self.WANTED_CAPS):
+                c.cap('REQ', *wanted)
+                return
+        elif subcommand == 'ACK':
+            self.caps.update(e.arguments[-1].split())
+            if 'draft/multiline' in self.caps:
+                self.multiline_limits = self.get_multiline_limits()
+                logger.debug(
+                    'Sending multiline messages of up to %s bytes and %s '
+                    'lines', *self.multiline_limits
+                )
+        elif subcommand != 'NAK':
+            return
+        c.cap('END')
+
+    def get_multiline_limits(self):
+        """Returns the most bytes and lines (or `None` if there's no
+        limit) a multiline batch may hold, as offered by the server."""
+        limits = {}
+        for limit in self.offered_caps.get('draft/multiline', '').split(','):
+            name, _, value = limit.partition('=')
+            if value.isdigit():
+                limits[name] = int(value)
+        return (
+            limits.get('max-bytes', self.DEFAULT_MULTILINE_BYTES),
+            limits.get('max-lines'),
+        )
+
     def on_nicknameinuse(self, c, e):
         c.nick(
             u"%s-%s" % (
@@ -51,34 +421,139 @@ class IrcpdbBot(SingleServerIRCBot):
             )
         )
 
+    def on_join(self, c, e):
+        if e.source.nick == c.get_nickname():
+            # The server echoes our own JOIN back to us with our full
+            # hostmask; that's exactly the prefix it'll put in front of
+            # every message we send to the channel.
+            self.hostmask = e.source
+            if self.connect_started and not self.ready.is_set():
+                self.time_to_ready = time.time() - self.connect_started
+                self.metrics.set('time_to_ready_seconds', self.time_to_ready)
+                logger.info(
+                    'Joined %s %.3f seconds after connecting',
+                    self.channel,
+                    self.time_to_ready,
+                )
+                self.ready.set()
+
     def on_welcome(self, c, e):
-        logger.debug('Received welcome message, joining %s', self.channel)
-        c.join(self.channel)
+        channels = ','.join(
+            target for target in [self.channel] + self.mirror_channels
+            if is_channel(target)
+        )
+        logger.debug('Received welcome message, joining %s', channels)
+        c.join(channels)
         self.joined = True
+        self.reconnect_backoff.reset()
+        disconnected_at, self.disconnected_at = self.disconnected_at, None
+        if disconnected_at is not None:
+            self.metrics.increment('irc_reconnects')
+            logger.info(
+                'Reconnected after %.1f seconds',
+                time.time() - disconnected_at,
+            )
+        if not self.attached:
+            return
+        if self.greeted:
+            self.resume(disconnected_at)
+        else:
+            self.greet()
+
+    def greet(self):
+        self.greeted = True
+        self.send_channel_message(self.get_greeting(), paste=False)
+        self.send_pre_join_queue()
+        self.send_prompt()
 
+    def resume(self, disconnected_at):
         self.send_channel_message(
-            [
-                "Debugger ready (on host %s)" % socket.gethostname(),
-                (
-                    "The following users are able to interact with this "
-                    "debugger: %s" % (
-                        ', '.join(self.limit_access_to)
-                    )
-                ),
-                (
-                    "Please prefix debugger commands with either '!' or "
-                    "'%s:'. For pdb help, say '!help'; for a list of "
-                    "ircpdb-specific commands, say '!!help'." % (
-                        self.connection.nickname
-                    )
-                )
-            ],
-            paste=False
+            "Reconnected after %.0f seconds; the debugger is where you "
+            "left it." % (time.time() - disconnected_at),
+            paste=False,
         )
-        for username, message in self.pre_join_queue:
-            self.send_user_message(username, message)
+        self.send_pre_join_queue()
         self.send_prompt()
 
+    def send_pre_join_queue(self):
+        if self.pre_join_dropped:
+            self.send_channel_message(
+                "(%s earlier messages were dropped)" % self.pre_join_dropped,
+                paste=False,
+            )
+        queued = list(self.pre_join_queue)
+        self.pre_join_queue.clear()
+        self.pre_join_dropped = 0
+        for username, message in queued:
+            self.send_user_message(username, message)
+
+    def disconnect(self, msg="Bye!"):
+        # We're leaving on purpose; there's no need to come back.
+        self.quitting = True
+        super(IrcpdbBot, self).disconnect(msg)
+
+    def _on_disconnect(self, c, e):
+        # Replaces `SingleServerIRCBot`'s reconnecting at a fixed
+        # interval.
+        self.channels = IRCDict()
+        self.joined = False
+        if self.quitting:
+            return
+        # The server may also drop us again before welcoming us back
+        # (e.g. for reconnecting too quickly), so keep trying; the
+        # deadline runs from when we were first disconnected.
+        if self.disconnected_at is None:
+            logger.warning('Disconnected from IRC; reconnecting.')
+            self.disconnected_at = time.time()
+            if self.reconnect_deadline:
+                self.reactor.execute_delayed(
+                    self.reconnect_deadline,
+                    functools.partial(
+                        self.on_reconnect_deadline, self.disconnected_at
+                    ),
+                )
+        self.schedule_reconnect()
+
+    def schedule_reconnect(self):
+        self.reactor.execute_delayed(
+            self.reconnect_backoff.get_delay(),
+            self.reconnect,
+        )
+
+    def reconnect(self):
+        if self.quitting or self.connection.is_connected():
+            return
+        self._connect()
+        if not self.connection.is_connected():
+            self.schedule_reconnect()
+
+    def on_reconnect_deadline(self, disconnected_at):
+        if self.disconnected_at != disconnected_at or not self.attached:
+            return
+        logger.warning(
+            'Unable to reconnect to IRC within %s seconds; continuing.',
+            self.reconnect_deadline,
+        )
+        self.continue_debugger()
+
+    def get_greeting(self):
+        return [
+            "Debugger ready (on host %s)" % socket.gethostname(),
+            (
+                "The following users are able to interact with this "
+                "debugger: %s" % (
+                    ', '.join(self.limit_access_to)
+                )
+            ),
+            (
+                "Please prefix debugger commands with either '!' or "
+                "'%s:'. For pdb help, say '!help'; for a list of "
+                "ircpdb-specific commands, say '!!help'." % (
+                    self.connection.nickname
+                )
+            )
+        ]
+
     def on_privmsg(self, c, e):
         self.send_user_message(
             e.source.nick,
@@ -110,7 +585,7 @@ class IrcpdbBot(SingleServerIRCBot):
         self.activated = True
         logger.debug('Received command: %s', cmd)
         nickname = e.source.nick
-        if nickname not in self.limit_access_to:
+        if not self.is_allowed(nickname, e.target):
             self.send_user_message(
                 nickname,
                 "I'm sorry, %s, you are not allowed to give commands "
@@ -156,7 +631,7 @@ class IrcpdbBot(SingleServerIRCBot):
                     "No users are allowed to interact with the debugger; "
                     "continuing from breakpoint."
                 )
-                self.queue.put('continue')
+                self.continue_debugger()
 
         elif cmd.startswith("!set_paste_minimum_response_length"):
             value = cmd.split(' ')
@@ -186,8 +661,66 @@ class IrcpdbBot(SingleServerIRCBot):
             except (TypeError, IndexError, ValueError):
                 self.send_channel_message(
                     "An error was encountered while setting the "
-                    "message_wait_seconds setting."
+                    "message_wait_seconds setting; it must be 0 (to "
+                    "disable throttling) or a positive number of seconds."
+                )
+        elif (
+            cmd.startswith(("!record", "!play")) and
+            not self.SUPPORTS_BATCHES
+        ):
+            # Macros are played back as a batch.
+            self.send_channel_message(
+                "Macros aren't available here; send each command on "
+                "its own instead."
+            )
+        elif cmd.startswith("!record"):
+            name = cmd[len("!record"):].strip()
+            if not name:
+                self.send_channel_message("Usage: !!record NAME")
+            else:
+                self.recording = (name, [], )
+                self.send_channel_message(
+                    "Recording macro %s; say !!stop when finished." % name
                 )
+        elif cmd.startswith("!stop"):
+            if self.recording is None:
+                self.send_channel_message("No macro is being recorded.")
+            else:
+                name, commands = self.recording
+                self.recording = None
+                self.macros.set(self.channel, name, commands)
+                self.send_channel_message(
+                    "Saved macro %s (%s commands); say !!play %s to run "
+                    "it." % (name, len(commands), name)
+                )
+        elif cmd.startswith("!play"):
+            name = cmd[len("!play"):].strip()
+            commands = self.macros.get(self.channel, name)
+            if not commands:
+                self.send_channel_message(
+                    "No macro named %s has been recorded; recorded macros: "
+                    "%s." % (
+                        name,
+                        ', '.join(self.macros.get_names(self.channel)) or
+                        'none',
+                    )
+                )
+            elif self.batch is not None:
+                self.send_channel_message(
+                    "Please wait for the current batch of commands to "
+                    "finish."
+                )
+            else:
+                self.start_batch(commands)
+        elif cmd.startswith("!stats"):
+            self.send_channel_message(self.metrics.summarize())
+        elif cmd.startswith("!full"):
+            if self.last_full_response is None:
+                self.send_channel_message(
+                    "No response has been abbreviated."
+                )
+            else:
+                self.send_channel_message(self.last_full_response)
         elif cmd.startswith("!help"):
             available_commands = textwrap.dedent("""
                 Available Commands:
@@ -209,24 +742,183 @@ class IrcpdbBot(SingleServerIRCBot):
                   (this is a measure used to prevent being kicked from
                   Freenode and other IRC servers that enforce limits on the
                   number of messages a client an send in a given period of
-                  time. Current value: {message_wait_seconds}.
+                  time; up to {message_burst} messages may be sent before
+                  this delay takes effect). Current value:
+                  {message_wait_seconds}.
+
+                * !!stats
+                  Display statistics about this debugging session (e.g.
+                  how long messages waited for the flood-control throttle
+                  and how long pastes took).
+
+                * !!full
+                  Send the full text of the last response that was sent
+                  as a diff (or as unchanged) in diff mode.
+
+                * !!record NAME, !!stop, !!play NAME
+                  Record the debugger commands sent until !!stop as a
+                  macro named NAME, and run them all again as a batch.
+
+                * !COMMAND; COMMAND; ...
+                  Run several debugger commands one after another, and
+                  send their output all at once.  Unless
+                  abort_batch_on_error is disabled, commands following one
+                  that fails are skipped.  Write a semicolon that's part of
+                  a command (outside of quotes) as \\;.
+
+                * !more, !page N, !grep PATTERN
+                  If only the first few lines of the debugger's output
+                  were sent, send the next few lines, the Nth page of
+                  lines, or the recent lines matching PATTERN.
             """.format(
                 limit_access_to=self.limit_access_to,
                 paste_minimum_response_length=(
                     self.paste_minimum_response_length
                 ),
                 message_wait_seconds=self.message_wait_seconds,
+                message_burst=self.bucket.burst,
             ))
             self.send_channel_message(
                 available_commands,
                 paste=True,
             )
+        elif not self.do_pager_command(cmd):
+            self.queue_commands(cmd)
+
+    def queue_commands(self, cmd):
+        if self.batch is not None:
+            self.send_channel_message(
+                "Please wait for the current batch of commands to finish."
+            )
+            return
+        commands = []
+        if self.SUPPORTS_BATCHES:
+            commands = split_commands(cmd)
+        if self.recording is not None:
+            self.recording[1].extend(commands or [cmd.strip()])
+        if len(commands) < 2:
+            self.queue.put(commands[0] if commands else cmd.strip())
+            return
+        self.start_batch(commands)
+
+    def start_batch(self, commands):
+        self.batch = Batch(commands, self.abort_batch_on_error)
+        self.queue.put(self.batch.get_next_command())
+
+    def do_pager_command(self, cmd):
+        """Answer `more`, `page N` or `grep PATTERN` from the pager.
+
+        Returns `False` if `cmd` should be passed along to pdb instead --
+        including `more` if there's nothing left in the pager, since pdb
+        has a `more` command of its own.
+        """
+        if self.pager is None:
+            return False
+        name, _, arg = cmd.strip().partition(' ')
+        arg = arg.strip()
+        if name == 'more':
+            if not self.pager.get_remaining():
+                return False
+            self.send_channel_message(self.pager.get_more())
+            self.send_pager_status()
+        elif name == 'page':
+            try:
+                number = int(arg)
+            except ValueError:
+                return False
+            lines = self.pager.get_page(number)
+            if lines is None:
+                self.send_channel_message(
+                    "Page %s isn't available; the last response has %s "
+                    "pages." % (number, self.pager.get_page_count())
+                )
+                return True
+            self.send_channel_message(lines)
+        elif name == 'grep' and arg:
+            try:
+                lines = self.pager.grep(arg)
+            except re.error as e:
+                self.send_channel_message(
+                    "Invalid pattern %s: %s" % (arg, e)
+                )
+                return True
+            if not lines:
+                self.send_channel_message(
+                    "No recent output matches %s." % arg
+                )
+                return True
+            self.send_channel_message(lines[:self.pager.page_lines])
+            if len(lines) > self.pager.page_lines:
+                self.send_channel_message(
+                    "(%s more matching lines not shown)" % (
+                        len(lines) - self.pager.page_lines
+                    )
+                )
         else:
-            self.queue.put(cmd.strip())
+            return False
+        return True
+
+    def send_pager_status(self):
+        remaining = self.pager.get_remaining()
+        if remaining:
+            self.send_channel_message(
+                "(%s more lines; say !more, !page N (of %s) or "
+                "!grep PATTERN)" % (remaining, self.pager.get_page_count()),
+                paste=False,
+            )
+
+    def is_allowed(self, nickname, channel=None):
+        """Returns whether `nickname` may give commands in `channel`.
+
+        Entries of `limit_access_to` are either a nickname, allowed to
+        give commands in any of our channels, or of the form
+        ``#channel:nickname``, allowed only in that channel.
+        """
+        for entry in self.limit_access_to:
+            allowed_channel, _, allowed_nickname = entry.rpartition(':')
+            if allowed_nickname != nickname:
+                continue
+            if not allowed_channel:
+                return True
+            if channel is not None and (
+                strings.lower(allowed_channel) == strings.lower(channel)
+            ):
+                return True
+        return False
+
+    def get_channel_target(self):
+        """Returns our channels as a single (comma-separated) target."""
+        return ','.join([self.channel] + self.mirror_channels)
+
+    def get_max_targets(self, command='PRIVMSG'):
+        """Returns how many targets the server accepts per `command`.
+
+        Servers advertise this in ISUPPORT's ``TARGMAX`` (or the older
+        ``MAXTARGETS``); those that don't are sent one target at a time.
+        Returns `None` if there's no limit.
+        """
+        features = self.connection.features
+        targmax = getattr(features, 'targmax', None)
+        if isinstance(targmax, dict):
+            return targmax.get(command, 1)
+        maxtargets = getattr(features, 'maxtargets', None)
+        if isinstance(maxtargets, int):
+            return maxtargets
+        return 1
+
+    def get_target_groups(self, target):
+        """Splits a comma-separated `target` into as few as the server
+        allows us to send a single message to."""
+        targets = target.split(',')
+        max_targets = self.get_max_targets() or len(targets)
+        return [
+            ','.join(targets[i:i + max_targets])
+            for i in range(0, len(targets), max_targets)
+        ]
 
     def send_channel_message(self, message, paste=None):
         return self.send_user_message(
-            self.channel,
+            self.get_channel_target(),
             message,
             paste=paste,
         )
@@ -238,55 +930,213 @@ class IrcpdbBot(SingleServerIRCBot):
                 'but was not yet joined to channel. Queueing...',
                 message
             )
+            if len(self.pre_join_queue) == self.pre_join_queue.maxlen:
+                self.pre_join_dropped += 1
             self.pre_join_queue.append(
                 (username, message, )
             )
             return
 
         if isinstance(message, six.string_types):
-            message_stripped = message.strip()
-            lines = message_stripped.split('\n')
+            lines = message.strip().split('\n')
         else:
             lines = message
-        chunked = self.get_chunked_lines(lines)
-        try:
-            long_response = len(chunked) >= self.paste_minimum_response_length
-            if (long_response and paste is None) or paste is True:
-                paste_url = self.send_lines_to_paste(lines)
-                self.send_lines(
-                    username, "See %s (%s lines in result)" % (
-                        paste_url,
-                        len(lines)
-                    )
-                )
-                return
-        except PasteError:
-            pass
+        budget = self.get_message_budget(username)
+        long_response = (
+            self.get_chunked_line_count(lines, budget) >=
+            self.paste_minimum_response_length
+        )
+        if (
+            self.paste_backend is not None and
+            ((long_response and paste is None) or paste is True)
+        ):
+            self.start_paste(username, lines)
+            return
+        self.send_chunked_lines(username, lines)
+
+    def send_chunked_lines(self, username, lines):
+        budget = self.get_message_budget(username)
+        chunked = self.get_chunked_lines(lines, budget)
+        if self.pack_lines:
+            chunked = self.get_packed_lines(chunked, budget)
         self.send_lines(username, chunked)
 
+    def get_paste_executor(self):
+        if self.paste_executor is None:
+            self.paste_executor = ThreadPoolExecutor(
+                max_workers=self.paste_workers
+            )
+        return self.paste_executor
+
+    def start_paste(self, username, lines):
+        """Upload `lines` to paste without blocking the bot's loop.
+
+        The upload happens on a worker thread; once it finishes, the
+        resulting URL is announced from the bot's loop.  If the upload
+        fails or does not finish within `paste_timeout` seconds,
+        `lines` are sent to IRC directly instead.
+        """
+        cache_key = None
+        if self.is_paste_cacheable():
+            cache_key = self.paste_cache.get_key(lines)
+            paste_url = self.paste_cache.get(cache_key)
+            if paste_url:
+                self.metrics.increment('paste_cache_hits')
+                self.send_paste_url(username, paste_url, lines)
+                return
+
+        self.send_lines(username, "Pasting %s lines..." % len(lines))
+        started = time.time()
+        future = self.get_paste_executor().submit(
+            self.send_lines_to_paste, lines
+        )
+        self.pending_pastes.add(future)
+        self.reactor.execute_delayed(
+            self.paste_timeout,
+            self.on_paste_timeout,
+            (future, username, lines, ),
+        )
+        future.add_done_callback(
+            lambda future: self.callbacks.put(
+                functools.partial(
+                    self.on_paste_complete,
+                    future, username, lines, cache_key, started,
+                )
+            )
+        )
+
+    def on_paste_complete(
+        self, future, username, lines, cache_key=None, started=None
+    ):
+        if future not in self.pending_pastes:
+            # We've already given up on this paste.
+            return
+        self.pending_pastes.remove(future)
+        try:
+            paste_url = future.result()
+        except PasteError as e:
+            logger.warning('Unable to paste output: %s', e)
+            self.metrics.increment('paste_failures')
+            self.send_chunked_lines(username, lines)
+            self.finish_closing()
+            return
+        if started is not None:
+            self.metrics.observe('paste_seconds', time.time() - started)
+        if cache_key is not None:
+            self.paste_cache.set(cache_key, paste_url)
+        self.send_paste_url(username, paste_url, lines)
+        self.finish_closing()
+
+    def is_paste_cacheable(self):
+        return (
+            self.paste_cache is not None and
+            getattr(self.paste_backend, 'cacheable', True)
+        )
+
+    def send_paste_url(self, username, paste_url, lines):
+        self.send_lines(
+            username, "See %s (%s lines in result)" % (
+                paste_url,
+                len(lines)
+            )
+        )
+
+    def on_paste_timeout(self, future, username, lines):
+        if future not in self.pending_pastes:
+            return
+        self.pending_pastes.remove(future)
+        future.cancel()
+        self.metrics.increment('paste_timeouts')
+        self.send_lines(
+            username,
+            "Paste did not complete within %s seconds; sending "
+            "output directly." % self.paste_timeout
+        )
+        self.send_chunked_lines(username, lines)
+        self.finish_closing()
+
     def send_prompt(self):
         if not self.joined:
             # We'll display a 'ready' message once we've joined anyway;
             # let's just silently drop this.
             return
         self.send_lines(
-            self.channel,
+            self.get_channel_target(),
             self.PROMPT,
             command='ACTION',
         )
 
+    def get_message_budget(self, target, command=None):
+        """Returns the number of bytes available for a message's text.
+
+        This is what remains of the 512-byte protocol limit after
+        accounting for the prefix the server will add when relaying the
+        message, the ``PRIVMSG <target> :`` command itself, any CTCP
+        framing, and the trailing CR/LF.
+        """
+        hostmask = self.hostmask
+        if not hostmask:
+            hostmask = '%s!%s@%s' % (
+                getattr(self.connection, 'real_nickname', self._nickname),
+                'x' * self.MAX_USERNAME_LENGTH,
+                'x' * self.MAX_HOSTNAME_LENGTH,
+            )
+        overhead = ':%s PRIVMSG %s :\r\n' % (hostmask, target)
+        if self.multiline_limits is not None:
+            # The `irc` library counts tags against the 512-byte limit,
+            # too.
+            overhead += '@batch=%s ' % ('x' * self.MAX_BATCH_ID_LENGTH)
+        if command is not None:
+            overhead += '\001%s \001' % command
+        return self.MAX_MESSAGE_BYTES - get_byte_length(overhead)
+
+    def get_chunked_line_count(self, lines, chunk_size=400):
+        """Returns roughly how many messages `lines` will be chunked into.
+
+        This avoids building the chunked lines themselves when we're
+        likely to paste them instead.
+        """
+        count = 0
+        for line in lines:
+            count += max(-(-get_byte_length(line) // chunk_size), 1)
+        return count
+
     def get_chunked_lines(self, lines, chunk_size=400):
         chunked_lines = []
         for line in lines:
-            if len(line) > chunk_size:
-                chunked_lines.extend([
-                    line[i:i+chunk_size]
-                    for i in range(0, len(line), chunk_size)
-                ])
+            if get_byte_length(line) > chunk_size:
+                chunked_lines.extend(split_utf8(line, chunk_size))
             else:
                 chunked_lines.append(line)
         return chunked_lines
 
+    def get_packed_lines(self, lines, budget):
+        """Join as many lines as will fit into each message.
+
+        `lines` are expected to already be chunked to fit within `budget`.
+        """
+        delimiter_length = get_byte_length(self.PACK_DELIMITER)
+        packed_lines = []
+        current = []
+        current_length = 0
+        for line in lines:
+            if not line:
+                continue
+            line_length = get_byte_length(line)
+            if current and (
+                current_length + delimiter_length + line_length > budget
+            ):
+                packed_lines.append(self.PACK_DELIMITER.join(current))
+                current = []
+                current_length = 0
+            if current:
+                current_length += delimiter_length
+            current.append(line)
+            current_length += line_length
+        if current:
+            packed_lines.append(self.PACK_DELIMITER.join(current))
+        return packed_lines
+
     def send_lines_to_paste(self, lines):
         try:
             return self.paste_backend.paste(lines)
@@ -301,74 +1151,405 @@ class IrcpdbBot(SingleServerIRCBot):
             suffix = '\001'
         if isinstance(lines, six.string_types):
             lines = [lines]
-        for part in lines:
-            if not part:
-                continue
-            self.connection.send_raw(
-                'PRIVMSG %s %s%s%s' % (
-                    target,
-                    prefix,
-                    part,
-                    suffix
+        lines = [part for part in lines if part]
+        # Each outbox entry is a list of raw messages to be sent at
+        # once, costing a single token; that's one message unless the
+        # server lets us send a multiline batch.
+        if (
+            self.multiline_limits is not None and
+            command is None and
+            len(lines) > 1
+        ):
+            for batch in self.get_multiline_batches(lines):
+                for single_target in target.split(','):
+                    self.outbox.append((
+                        self.get_multiline_messages(single_target, batch),
+                        time.time(),
+                    ))
+        else:
+            # Each line is sent to all of our targets before the next,
+            # so that every channel receives output at the same pace.
+            groups = self.get_target_groups(target)
+            for part in lines:
+                for group in groups:
+                    self.outbox.append((
+                        [
+                            'PRIVMSG %s %s%s%s' % (
+                                group,
+                                prefix,
+                                part,
+                                suffix
+                            ),
+                        ],
+                        time.time(),
+                    ))
+        self.metrics.observe('irc_outbox_depth', len(self.outbox))
+        if not self.drain_scheduled:
+            self.drain_outbox()
+
+    def drain_outbox(self):
+        self.drain_scheduled = False
+        if not self.connection.is_connected():
+            # We'll send these once we've reconnected.
+            return
+        while self.outbox:
+            if not self.bucket.consume():
+                self.drain_scheduled = True
+                self.reactor.execute_delayed(
+                    self.bucket.get_wait_seconds(),
+                    self.drain_outbox,
                 )
-            )
-            if self.message_wait_seconds:
-                time.sleep(self.message_wait_seconds)
+                return
+            messages, queued = self.outbox.popleft()
+            waited = time.time() - queued
+            self.metrics.observe('irc_throttle_wait_seconds', waited)
+            if (
+                self.flood_control is not None and
+                waited > self.THROTTLED_SECONDS and
+                self.flood_control.on_throttled_send()
+            ):
+                self.apply_flood_control()
+            self.metrics.increment('irc_messages_sent')
+            for message in messages:
+                self.connection.send_raw(message)
+        self.finish_closing()
 
-    def process_forever(self, inhandle, outhandle, timeout=0.1):
-        self._connect()
+    def get_multiline_batches(self, lines):
+        """Split `lines` into as few multiline batches as will fit."""
+        max_bytes, max_lines = self.multiline_limits
+        batches = []
+        current = []
+        current_length = 0
+        for line in lines:
+            # Lines in a batch are joined by newlines.
+            line_length = get_byte_length(line) + (1 if current else 0)
+            if current and (
+                current_length + line_length > max_bytes or
+                (max_lines and len(current) >= max_lines)
+            ):
+                batches.append(current)
+                current = []
+                current_length = 0
+                line_length -= 1
+            current.append(line)
+            current_length += line_length
+        if current:
+            batches.append(current)
+        return batches
+
+    def get_multiline_messages(self, target, lines):
+        if len(lines) == 1:
+            return ['PRIVMSG %s :%s' % (target, lines[0])]
+        self.next_batch_id += 1
+        batch_id = 'p%x' % (
+            self.next_batch_id % 16 ** (self.MAX_BATCH_ID_LENGTH - 1)
+        )
+        return (
+            ['BATCH +%s draft/multiline %s' % (batch_id, target)] +
+            [
+                '@batch=%s PRIVMSG %s :%s' % (batch_id, target, line)
+                for line in lines
+            ] +
+            ['BATCH -%s' % batch_id]
+        )
+
+    def get_select_timeout(self):
+        """Returns the number of seconds until the next scheduled command.
+
+        Returns `None` if nothing is scheduled, in which case we can wait
+        indefinitely for one of our file descriptors to become readable.
+        """
+        with self.reactor.mutex:
+            if not self.reactor.delayed_commands:
+                return None
+            next_command = self.reactor.delayed_commands[0]
+        return max((next_command - schedule.now()).total_seconds(), 0)
+
+    def close(self):
+        """Disconnect and stop once all remaining output has been sent.
+
+        Messages waiting for the throttle and pastes still uploading
+        are sent first; `closed` is set once we're done.
+        """
+        # There's nothing more to relay from pdb.
+        self.readers.clear()
+        self.closing = True
+        self.finish_closing()
+
+    def finish_closing(self):
+        if not self.closing or self.outbox or self.pending_pastes:
+            return
+        if not self.closed.is_set():
+            self.disconnect()
+            self.stop()
+            self.closed.set()
+
+    def stop(self):
+        self.running = False
+        # Interrupt the bot's `select` call if it's waiting.
+        self.queue.wake()
+
+    def continue_debugger(self):
+        self.queue.put('continue')
+
+    def on_activation_timeout(self):
+        if self.activated:
+            return
+        self.send_channel_message(
+            [
+                "No response received within %s seconds; "
+                "disconnecting due to inactivity." % (
+                    self.activation_timeout
+                )
+            ],
+            paste=False,
+        )
+        self.continue_debugger()
+
+    def add_reader(self, fileobj, callback):
+        """Call `callback` from the bot's loop when `fileobj` is readable."""
+        self.readers[fileobj] = callback
+
+    def remove_reader(self, fileobj):
+        self.readers.pop(fileobj, None)
+
+    def remove_closed_readers(self):
+        for fileobj in list(self.readers):
+            if getattr(fileobj, 'closed', False):
+                self.remove_reader(fileobj)
+
+    def process_forever(self, inhandle, outhandle):
+        self.attach(inhandle, outhandle)
+        self.run()
+
+    def attach_threadsafe(self, inhandle, outhandle):
+        """Hand pdb's pipes to a bot already running on another thread."""
+        self.callbacks.put(
+            functools.partial(self.attach, inhandle, outhandle)
+        )
+
+    def attach(self, inhandle, outhandle):
+        """Start relaying between pdb and IRC.
+
+        Must be called from the bot's thread (or before it starts
+        running); see `attach_threadsafe`.
+        """
         # Let's mark out inhandle as non-blocking
         fcntl.fcntl(inhandle, fcntl.F_SETFL, os.O_NONBLOCK)
-        # Used for keeping track of when the bot was started
-        # so we can disconnect for inactivity.
-        started = time.time()
-        # Keeps track of whether or not we're in the process of
-        # disconnecting (queued the 'q' command)
-        disconnecting = False
+        self.outhandle = outhandle
+        self.add_reader(
+            inhandle,
+            functools.partial(
+                self.on_pdb_output,
+                FrameReader(
+                    inhandle.fileno(),
+                    max_frame_bytes=self.max_response_bytes,
+                ),
+            )
+        )
+        self.reactor.execute_delayed(
+            self.activation_timeout,
+            self.on_activation_timeout,
+        )
+        # pdb's first response isn't to any command.
+        self.pending_commands = deque([(None, None, )])
+        self.attached = True
+        if self.joined:
+            self.greet()
+
+    def on_pdb_output(self, reader):
+        frames = reader.read()
+        if reader.last_read:
+            self.metrics.observe('pdb_read_bytes', reader.last_read)
+        for message, complete in frames:
+            command = None
+            if complete and self.pending_commands:
+                command, sent = self.pending_commands.popleft()
+                if sent is not None:
+                    self.metrics.observe(
+                        'pdb_command_seconds', time.time() - sent
+                    )
+            if self.diff_mode:
+                message = self.get_diffed_response(command, message, complete)
+            if self.batch is not None:
+                self.batch.add_output(message, complete)
+            else:
+                self.send_debugger_output(message, complete)
+        prompted = any(complete for _, complete in frames)
+        if prompted and self.batch is not None:
+            # Feed pdb the batch's next command straight away rather
+            # than prompting for one.
+            command = self.batch.get_next_command()
+            if command is not None:
+                self.send_command(command)
+                prompted = False
+            else:
+                self.finish_batch()
+        if reader.eof and self.batch is not None:
+            self.finish_batch()
+        if prompted:
+            self.send_prompt()
+        if reader.eof:
+            # pdb has closed its end of the pipe.
+            self.close()
+
+    def finish_batch(self):
+        lines = self.batch.get_lines()
+        self.batch = None
+        self.send_debugger_output(u'\n'.join(lines), True)
+
+    def get_diffed_response(self, command, message, complete):
+        """Returns what to send in place of pdb's response to `command`.
+
+        If the response is identical to the last response to the same
+        command, or a diff against that is shorter, send that instead.
+        """
+        if not complete:
+            # Large responses arrive in pieces; they aren't worth keeping
+            # around to diff against.
+            self.response_partial = True
+            return message
+        partial, self.response_partial = self.response_partial, False
+        if (
+            partial or command is None or
+            command.split(' ', 1)[0] in self.UNDIFFED_COMMANDS
+        ):
+            return message
+
+        response = message.strip()
+        previous = self.last_responses.pop(command, None)
+        self.last_responses[command] = response
+        while len(self.last_responses) > self.MAX_DIFFED_COMMANDS:
+            self.last_responses.popitem(last=False)
+        if previous is None:
+            return message
+        if previous == response:
+            self.last_full_response = response
+            return "(unchanged; say !!full to see it in full)"
+
+        lines = response.split('\n')
+        diff = [
+            line for line in difflib.unified_diff(
+                previous.split('\n'), lines, n=1, lineterm=''
+            )
+            if not line.startswith(('---', '+++', ))
+        ]
+        if len(diff) + 1 >= len(lines):
+            return message
+        self.last_full_response = response
+        return '\n'.join(
+            [
+                "(changes since the last '%s'; say !!full to see it in "
+                "full)" % command
+            ] + diff
+        )
+
+    def send_debugger_output(self, message, complete):
+        stripped = message.strip()
+        if stripped:
+            logger.debug('>> %s', stripped)
+        if self.pager is None:
+            if stripped:
+                self.send_channel_message(stripped)
+            return
+        if stripped:
+            lines = self.pager.add(stripped.split('\n'))
+            if lines:
+                self.send_channel_message(lines)
+        if complete and self.pager.finish():
+            self.send_pager_status()
+
+    def send_command(self, command):
+        if self.outhandle is None:
+            logger.debug('No debugger attached; dropping %s', command)
+            return
+        logger.debug('<< %s', command)
+        if command.strip():
+            self.last_command = command.strip()
+        # An empty command repeats the last one.
+        self.pending_commands.append((self.last_command, time.time(), ))
+        self.metrics.increment('pdb_commands')
+        try:
+            self.outhandle.write(u'%s\n' % command)
+            self.outhandle.flush()
+        except (IOError, ValueError):
+            # pdb has already closed its end of the pipe.
+            logger.debug('Debugger has exited; dropping %s', command)
+            self.close()
 
-        while True:
+    def dump_metrics(self):
+        self.metrics.dump(self.metrics_path)
+
+    def run(self):
+        # Set before connecting, so that being stopped while we connect
+        # (which can take a while) isn't forgotten.
+        self.running = True
+        self.connect_started = time.time()
+        self._connect()
+        if not self.running:
+            self.disconnect()
+            return
+        if not self.connection.is_connected():
+            self.schedule_reconnect()
+        if self.metrics_path:
+            self.reactor.execute_every(
+                self.metrics_interval, self.dump_metrics
+            )
+        if self.lag_monitor is not None:
+            self.reactor.execute_every(
+                self.lag_check_seconds, self.check_lag
+            )
+        while self.running:
+            # Wait until pdb has written output, the IRC server has
+            # sent us something, a command has been queued for pdb,
+            # or a scheduled command (e.g. sending throttled output)
+            # is due -- whichever happens first.
+            readers = list(self.readers) + [
+                self.queue, self.callbacks
+            ] + self.reactor.sockets
             try:
-                messages = inhandle.read()
-            except IOError:
-                messages = None
-            if messages:
-                for message in messages.split('(Pdb)'):
-                    stripped = message.strip()
-                    if stripped:
-                        logger.debug('>> %s', stripped)
-                        self.send_channel_message(stripped)
-                self.send_prompt()
+                readable, _, _ = select.select(
+                    readers, [], [], self.get_select_timeout()
+                )
+            except (select.error, ValueError, OSError):
+                # One of our descriptors was closed from another thread
+                # (e.g. during shutdown); re-check and try again.
+                self.remove_closed_readers()
+                continue
+
+            iteration_started = time.time()
+            for fileobj in readable:
+                if fileobj in self.readers:
+                    self.readers[fileobj]()
+            if not self.running:
+                break
 
             try:
-                self.reactor.process_once(timeout)
+                self.reactor.process_data(
+                    [r for r in readable if r in self.reactor.sockets]
+                )
             except UnicodeDecodeError:
                 # This just *happens* -- I think these are coming from
                 # maybe MOTD messages?  It isn't clear.
                 logger.warning(
                     'UnicodeDecodeError raised while processing messages.'
                 )
+            self.reactor.process_timeout()
 
-            while True:
-                if self.queue.empty():
-                    break
-                message = self.queue.get(block=False)
-                logger.debug('<< %s', message)
-                outhandle.write(u'%s\n' % message)
-                outhandle.flush()
+            for callback in self.callbacks.drain():
+                callback()
 
-            if (
-                time.time() > started + self.activation_timeout and
-                not self.activated and
-                not disconnecting
-            ):
-                self.send_channel_message(
-                    [
-                        "No response received within %s seconds; "
-                        "disconnecting due to inactivity." % (
-                            self.activation_timeout
-                        )
-                    ],
-                    paste=False,
-                )
-                disconnecting = True
-                self.queue.put('c')
+            for command in self.queue.drain():
+                self.send_command(command)
+            self.metrics.observe(
+                'loop_iteration_seconds', time.time() - iteration_started
+            )
+
+        if self.metrics_path:
+            self.dump_metrics()
+        if self.flood_control is not None:
+            self.save_flood_profile()
+        self.queue.close()
+        self.callbacks.close()
+        if self.paste_executor is not None:
+            self.paste_executor.shutdown(wait=False)
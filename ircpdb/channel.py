@@ -0,0 +1,74 @@
+from collections import deque
+import fcntl
+import os
+import threading
+
+from six.moves.queue import Empty
+
+
+class CommandChannel(object):
+    """In-process FIFO used for handing commands to the bot's loop.
+
+    Unlike `multiprocessing.Queue`, items are never pickled and no feeder
+    thread is involved; a byte is written to an internal pipe whenever
+    something is put into the channel, so the channel itself can be
+    handed to `select` and will become readable immediately.
+    """
+    def __init__(self):
+        self.items = deque()
+        self.lock = threading.Lock()
+        self.closed = False
+        self.r_pipe, self.w_pipe = os.pipe()
+        for fd in (self.r_pipe, self.w_pipe):
+            fcntl.fcntl(fd, fcntl.F_SETFL, os.O_NONBLOCK)
+
+    def fileno(self):
+        return self.r_pipe
+
+    def wake(self):
+        """Make the channel readable without putting anything into it."""
+        with self.lock:
+            if self.closed:
+                return
+            try:
+                os.write(self.w_pipe, b'\0')
+            except OSError:
+                # The pipe is full, so the reader has plenty of wake-ups
+                # waiting for it already.
+                pass
+
+    def put(self, item):
+        with self.lock:
+            self.items.append(item)
+        self.wake()
+
+    def get(self):
+        with self.lock:
+            try:
+                return self.items.popleft()
+            except IndexError:
+                raise Empty()
+
+    def empty(self):
+        return not self.items
+
+    def drain(self):
+        """Clear pending wake-ups and return every item in the channel."""
+        with self.lock:
+            if not self.closed:
+                try:
+                    while os.read(self.r_pipe, 4096):
+                        pass
+                except OSError:
+                    pass
+            items = list(self.items)
+            self.items.clear()
+        return items
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            os.close(self.r_pipe)
+            os.close(self.w_pipe)
@@ -0,0 +1,88 @@
+import random
+import threading
+import time
+
+
+# Keyword arguments to `set_trace` that are handled here rather than
+# being passed along to `Ircpdb`.
+CONDITIONS = ('when', 'sample_rate', 'max_hits', 'cooldown', )
+
+
+class CallSite(object):
+    """Records how often the breakpoint at one call site has fired."""
+    def __init__(self):
+        self.hits = 0
+        self.last_hit = None
+
+
+_call_sites = {}
+_lock = threading.Lock()
+
+
+def get_call_site(frame):
+    key = (frame.f_code, frame.f_lineno, )
+    try:
+        return _call_sites[key]
+    except KeyError:
+        with _lock:
+            return _call_sites.setdefault(key, CallSite())
+
+
+def reset():
+    """Forget how often every call site's breakpoint has fired."""
+    with _lock:
+        _call_sites.clear()
+
+
+def should_break(
+    frame, when=None, sample_rate=None, max_hits=None, cooldown=None,
+    random=random.random, clock=time.time
+):
+    """Returns `True` if the breakpoint called from `frame` should fire.
+
+    * `when`: a value or a callable taking no arguments; the breakpoint
+      only fires if it is (or returns) truthy.
+    * `sample_rate`: the probability of firing when the breakpoint
+      would otherwise fire (e.g. ``0.0001`` for one in ten thousand).
+    * `max_hits`: the maximum number of times the breakpoint at this
+      call site will fire.
+    * `cooldown`: the minimum number of seconds between two firings of
+      the breakpoint at this call site.
+
+    The call site's `max_hits` and `cooldown` are checked first, then
+    `sample_rate`, and `when` -- which may be arbitrarily expensive --
+    last, so that calls which won't break return as quickly as possible.
+    """
+    site = None
+    if max_hits is not None or cooldown is not None:
+        site = get_call_site(frame)
+        if max_hits is not None and site.hits >= max_hits:
+            return False
+        if cooldown is not None and site.last_hit is not None and (
+            clock() - site.last_hit < cooldown
+        ):
+            return False
+
+    if sample_rate is not None and random() >= sample_rate:
+        return False
+
+    if when is not None:
+        if callable(when):
+            when = when()
+        if not when:
+            return False
+
+    if site is None:
+        return True
+    with _lock:
+        # Another thread may have hit this breakpoint since we checked.
+        now = clock()
+        if max_hits is not None and site.hits >= max_hits:
+            return False
+        if cooldown is not None and site.last_hit is not None and (
+            now - site.last_hit < cooldown
+        ):
+            return False
+        site.hits += 1
+        site.last_hit = now
+    return True
@@ -1,10 +1,13 @@
+import json
 import logging
 import os
 import pdb
 import socket
 import ssl as ssllib
+import struct
 import sys
-from threading import Thread
+import time
+from threading import current_thread, Lock, Thread
 import traceback
 
 from irc.connection import Factory
@@ -12,8 +15,13 @@ import six
 
 from . import paste_backends
 from .bot import IrcpdbBot
+from .conditions import CONDITIONS, should_break
 from .exceptions import NoAllowedNicknamesSelected, NoChannelSelected
+from .flood import DEFAULT_PROFILE_PATH
+from .macros import DEFAULT_MACRO_PATH
 from .parse import parse_irc_uri
+from .render import BoundedRenderer, Pager
+from .snapshot import Snapshot
 
 
 logger = logging.getLogger(__name__)
@@ -27,66 +35,270 @@ DEFAULT_PARAMS = {
     'password': None,
     'ssl': True,
     'limit_access_to': None,
+    'mirror_channels': None,
+    'shutdown_timeout': 30,
+    'multiline': True,
     'message_wait_seconds': 0.8,
+    'message_burst': 5,
+    'pack_lines': False,
     'paste_minimum_response_length': 20,
-    'activation_timeout': 60
+    'paste_backend': 'gist',
+    'paste_timeout': 10,
+    'paste_cache_size': 128,
+    'paste_cache_ttl': 3600,
+    'paste_cache_path': None,
+    'activation_timeout': 60,
+    'max_response_bytes': 1048576,
+    'repr_max_depth': 4,
+    'repr_max_items': 100,
+    'repr_max_bytes': 4096,
+    'pager_lines': 0,
+    'pager_buffer_lines': 1000,
+    'diff_mode': False,
+    'abort_batch_on_error': True,
+    'macro_path': DEFAULT_MACRO_PATH,
+    'metrics_path': None,
+    'metrics_interval': 60,
+    'adaptive_flood_control': False,
+    'flood_profile_path': DEFAULT_PROFILE_PATH,
+    'lag_check_seconds': 15,
+    'reconnect_min_seconds': 1,
+    'reconnect_max_seconds': 60,
+    'reconnect_deadline': 300,
+    'reconnect_buffer_messages': 100,
+    'hub': None,
 }
 
 
+def get_params(uri=None, **kwargs):
+    params = DEFAULT_PARAMS.copy()
+    params.update(parse_irc_uri(uri))
+    params.update(kwargs)
+    return params
+
+
+def create_bot(params, bot_class=None):
+    """Validate `params` and create a bot (and paste backend) using them."""
+    if not params.get('limit_access_to'):
+        raise NoAllowedNicknamesSelected(
+            "You must specify a list of nicknames that are allowed "
+            "to interact with the debugger using the "
+            "`limit_access_to` keyword argument."
+        )
+    elif isinstance(params.get('limit_access_to'), six.string_types):
+        params['limit_access_to'] = [params.get('limit_access_to')]
+
+    connect_params = {}
+    if not params.get('nickname'):
+        params['nickname'] = socket.gethostname().split('.')[0]
+    if not params.get('channel'):
+        raise NoChannelSelected(
+            "You must specify a channel to connect to using the "
+            "`channel` keyword argument."
+        )
+    if params.get('ssl'):
+        connect_params['connect_factory'] = (
+            Factory(wrapper=ssllib.wrap_socket)
+        )
+
+    # Writes to stdout are forbidden in mod_wsgi environments
+    try:
+        logger.info(
+            "ircpdb has connected to %s:%s on %s\n",
+            params.get('server'),
+            params.get('port'),
+            params.get('channel')
+        )
+    except IOError:
+        pass
+
+    paste_backend = params.get('paste_backend')
+    if isinstance(paste_backend, six.string_types):
+        paste_backend = paste_backends.get_backend(paste_backend, params)
+
+    if bot_class is None:
+        bot_class = IrcpdbBot
+    return bot_class(
+        channel=params.get('channel'),
+        nickname=params.get('nickname'),
+        server=params.get('server'),
+        port=params.get('port'),
+        password=params.get('password'),
+        limit_access_to=params.get('limit_access_to'),
+        message_wait_seconds=params.get('message_wait_seconds'),
+        message_burst=params.get('message_burst'),
+        pack_lines=params.get('pack_lines'),
+        paste_minimum_response_length=(
+            params.get('paste_minimum_response_length')
+        ),
+        paste_backend=paste_backend,
+        paste_timeout=params.get('paste_timeout'),
+        paste_cache_size=params.get('paste_cache_size'),
+        paste_cache_ttl=params.get('paste_cache_ttl'),
+        paste_cache_path=params.get('paste_cache_path'),
+        max_response_bytes=params.get('max_response_bytes'),
+        pager_lines=params.get('pager_lines'),
+        pager_buffer_lines=params.get('pager_buffer_lines'),
+        diff_mode=params.get('diff_mode'),
+        abort_batch_on_error=params.get('abort_batch_on_error'),
+        macro_path=params.get('macro_path'),
+        metrics_path=params.get('metrics_path'),
+        metrics_interval=params.get('metrics_interval'),
+        adaptive_flood_control=params.get('adaptive_flood_control'),
+        flood_profile_path=params.get('flood_profile_path'),
+        lag_check_seconds=params.get('lag_check_seconds'),
+        reconnect_min_seconds=params.get('reconnect_min_seconds'),
+        reconnect_max_seconds=params.get('reconnect_max_seconds'),
+        reconnect_deadline=params.get('reconnect_deadline'),
+        reconnect_buffer_messages=params.get('reconnect_buffer_messages'),
+        mirror_channels=params.get('mirror_channels'),
+        multiline=params.get('multiline'),
+        activation_timeout=params.get('activation_timeout'),
+        **connect_params
+    )
+
+
+# The bot started by `warm`, and the parameters it was created with.
+_warm_lock = Lock()
+_warm_bot = None
+_warm_params = None
+
+
+def warm(uri=None, **kwargs):
+    """Connect to IRC ahead of time for use by the next `set_trace` call.
+
+    Accepts the same arguments as `set_trace`; the bot connects and
+    joins its channel on a background thread, so the first breakpoint
+    hit with matching arguments can start relaying straight away rather
+    than waiting on the IRC handshake.  Returns the bot, whose
+    `time_to_ready` attribute is set once it has joined its channel.
+    """
+    global _warm_bot, _warm_params
+    if uri is None and not kwargs and 'DEFAULT_IRCPDB_URI' in os.environ:
+        uri = os.environ['DEFAULT_IRCPDB_URI']
+    params = get_params(uri, **kwargs)
+    with _warm_lock:
+        if _warm_bot is not None:
+            return _warm_bot
+        bot = create_bot(dict(params))
+        thread = Thread(target=bot.run, name='ircpdb-warm')
+        thread.daemon = True
+        thread.start()
+        _warm_bot, _warm_params = bot, params
+    return bot
+
+
+def take_warm_bot(params):
+    """Return the bot started by `warm` if it was created using `params`.
+
+    A warm bot is only ever handed out once.  It's handed out even if
+    it's still connecting (or reconnecting) to IRC; it'll greet the
+    channel once it has joined it.
+    """
+    global _warm_bot, _warm_params
+    with _warm_lock:
+        if _warm_bot is None or _warm_params != params:
+            return None
+        bot = _warm_bot
+        _warm_bot = _warm_params = None
+    return bot
+
+
+def get_socket_owner(sock, path):
+    """Returns the ID of the user listening on the Unix socket `sock`."""
+    if hasattr(socket, 'SO_PEERCRED'):
+        credentials = sock.getsockopt(
+            socket.SOL_SOCKET,
+            socket.SO_PEERCRED,
+            struct.calcsize('3i'),
+        )
+        _, uid, _ = struct.unpack('3i', credentials)
+        return uid
+    return os.stat(path).st_uid
+
+
+def connect_to_hub(path):
+    """Attach to the ircpdb hub listening at `path`.
+
+    Returns the connected socket, or `None` if the hub isn't reachable.
+    """
+    hub_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        hub_socket.connect(path)
+        owner = get_socket_owner(hub_socket, path)
+        if owner != os.getuid():
+            # Whoever is listening gets to run arbitrary code here.
+            logger.warning(
+                "The ircpdb hub at %s belongs to another user (%s); "
+                "connecting to IRC directly.", path, owner
+            )
+            hub_socket.close()
+            return None
+        hub_socket.sendall(
+            json.dumps({
+                'host': socket.gethostname(),
+                'pid': os.getpid(),
+                'thread': current_thread().name,
+            }).encode('utf-8') + b'\n'
+        )
+    except socket.error as e:
+        logger.warning(
+            "Unable to attach to the ircpdb hub at %s (%s); connecting "
+            "to IRC directly.", path, e
+        )
+        hub_socket.close()
+        return None
+    return hub_socket
+
+
 class Ircpdb(pdb.Pdb):
     def __init__(self, uri=None, **kwargs):
         """Initialize the socket and initialize pdb."""
-        params = DEFAULT_PARAMS.copy()
-        params.update(parse_irc_uri(uri))
-        params.update(kwargs)
+        params = get_params(uri, **kwargs)
 
         # Backup stdin and stdout before replacing them by the socket handle
         self.old_stdout = sys.stdout
         self.old_stdin = sys.stdin
         self.read_timeout = 0.1
+        self.shutdown_timeout = params.get('shutdown_timeout')
 
-        if not params.get('limit_access_to'):
-            raise NoAllowedNicknamesSelected(
-                "You must specify a list of nicknames that are allowed "
-                "to interact with the debugger using the "
-                "`limit_access_to` keyword argument."
-            )
-        elif isinstance(params.get('limit_access_to'), six.string_types):
-            params['limit_access_to'] = [params.get('limit_access_to')]
-
-        connect_params = {}
-        if not params.get('nickname'):
-            params['nickname'] = socket.gethostname().split('.')[0]
-        if not params.get('channel'):
-            raise NoChannelSelected(
-                "You must specify a channel to connect to using the "
-                "`channel` keyword argument."
-            )
-        if params.get('ssl'):
-            connect_params['connect_factory'] = (
-                Factory(wrapper=ssllib.wrap_socket)
-            )
+        self.repr_max_depth = params.get('repr_max_depth')
+        self.repr_max_items = params.get('repr_max_items')
+        self.repr_max_bytes = params.get('repr_max_bytes')
+        # The rest of the last value printed by `p` or `pp`, if it
+        # didn't fit on a single page.
+        self.pager = None
 
-        # Writes to stdout are forbidden in mod_wsgi environments
-        try:
-            logger.info(
-                "ircpdb has connected to %s:%s on %s\n",
-                params.get('server'),
-                params.get('port'),
-                params.get('channel')
-            )
-        except IOError:
-            pass
+        self.hub_socket = None
+        self.bot_warmed = False
+        if params.get('hub'):
+            self.hub_socket = connect_to_hub(params.get('hub'))
+
+        if self.hub_socket is not None:
+            # The hub relays pdb's input and output over its socket; it
+            # has its own bot, so we need neither a bot nor pipes.
+            self.bot = None
+            self.paste_backend = None
+            self.p_A_pipe = self.hub_socket.makefile('r')
+            self.p_B_pipe = self.hub_socket.makefile('w')
+            self.b_A_pipe = self.b_B_pipe = None
+        else:
+            self.bot = take_warm_bot(params)
+            if self.bot is not None:
+                self.bot_warmed = True
+            else:
+                self.bot = create_bot(params)
+            self.paste_backend = self.bot.paste_backend
 
-        r_pipe, w_pipe = os.pipe()
-        # The A pipe is from the bot to pdb
-        self.p_A_pipe = os.fdopen(r_pipe, 'r')
-        self.b_A_pipe = os.fdopen(w_pipe, 'w')
+            r_pipe, w_pipe = os.pipe()
+            # The A pipe is from the bot to pdb
+            self.p_A_pipe = os.fdopen(r_pipe, 'r')
+            self.b_A_pipe = os.fdopen(w_pipe, 'w')
 
-        r_pipe, w_pipe = os.pipe()
-        # The B pipe is from pdb to the bot
-        self.b_B_pipe = os.fdopen(r_pipe, 'r')
-        self.p_B_pipe = os.fdopen(w_pipe, 'w')
+            r_pipe, w_pipe = os.pipe()
+            # The B pipe is from pdb to the bot
+            self.b_B_pipe = os.fdopen(r_pipe, 'r')
+            self.p_B_pipe = os.fdopen(w_pipe, 'w')
 
         pdb.Pdb.__init__(
             self,
@@ -94,34 +306,48 @@ class Ircpdb(pdb.Pdb):
             stdout=self.p_B_pipe,
         )
 
-        paste_backend = paste_backends.GistBackend()
-        self.bot = IrcpdbBot(
-            channel=params.get('channel'),
-            nickname=params.get('nickname'),
-            server=params.get('server'),
-            port=params.get('port'),
-            password=params.get('password'),
-            limit_access_to=params.get('limit_access_to'),
-            message_wait_seconds=params.get('message_wait_seconds'),
-            paste_minimum_response_length=(
-                params.get('paste_minimum_response_length')
-            ),
-            paste_backend=paste_backend,
-            activation_timeout=params.get('activation_timeout'),
-            **connect_params
+    def start_bot(self):
+        """Start relaying between pdb and IRC."""
+        if self.bot_warmed:
+            # The bot's loop is already running; just hand it our pipes.
+            self.bot.attach_threadsafe(self.b_B_pipe, self.b_A_pipe)
+            return
+        irc_feeder = Thread(
+            target=self.bot.process_forever,
+            args=(self.b_B_pipe, self.b_A_pipe, ),
         )
+        irc_feeder.daemon = True
+        irc_feeder.start()
 
     def shutdown(self):
         """Revert stdin and stdout, close the socket."""
         sys.stdout = self.old_stdout
         sys.stdin = self.old_stdin
-        pipes = [
-            self.p_A_pipe,
-            self.p_B_pipe,
-            self.b_A_pipe,
-            self.b_B_pipe
-        ]
+        # Closing our ends of the pipes tells the bot we're done; it
+        # sends whatever output it still has (e.g. the rest of a batch
+        # of commands, or a paste still uploading) before disconnecting.
+        self.close_pipes([self.p_A_pipe, self.p_B_pipe])
+        if self.hub_socket is not None:
+            self.hub_socket.close()
+        if self.bot is not None:
+            if self.bot.running and not self.bot.closed.wait(
+                self.shutdown_timeout
+            ):
+                logger.warning(
+                    "Unable to send the debugger's remaining output within "
+                    "%s seconds; disconnecting anyway.",
+                    self.shutdown_timeout,
+                )
+            self.bot.disconnect()
+            self.bot.stop()
+        self.close_pipes([self.b_A_pipe, self.b_B_pipe])
+        if self.paste_backend is not None:
+            self.paste_backend.close()
+
+    def close_pipes(self, pipes):
         for pipe in pipes:
+            if pipe is None:
+                continue
             try:
                 pipe.close()
             except IOError:
@@ -129,7 +355,68 @@ class Ircpdb(pdb.Pdb):
                     "IOError encountered while closing a pipe; messages "
                     "may have been lost."
                 )
-        self.bot.disconnect()
+
+    def write(self, line):
+        self.stdout.write(u'%s\n' % line)
+
+    def print_value(self, arg, pretty):
+        try:
+            value = self._getval(arg)
+        except Exception:
+            # pdb has already displayed the error.
+            return
+        renderer = BoundedRenderer(
+            max_depth=self.repr_max_depth,
+            max_items=self.repr_max_items,
+            max_bytes=self.repr_max_bytes,
+            pretty=pretty,
+        )
+        try:
+            self.pager = Pager(
+                renderer.iter_tokens(value), self.repr_max_bytes
+            )
+        except Exception:
+            self.write_exception()
+            return
+        self.do_more('')
+
+    def write_exception(self):
+        """Displays the exception being handled the way pdb does, and
+        forgets the value being paged through."""
+        self.pager = None
+        message = traceback.format_exception_only(*sys.exc_info()[:2])
+        self.write('*** %s' % message[-1].strip())
+
+    def do_p(self, arg):
+        """p expression
+        Print the value of the expression, a page at a time.
+        """
+        self.print_value(arg, pretty=False)
+
+    def do_pp(self, arg):
+        """pp expression
+        Pretty-print the value of the expression, a page at a time.
+        """
+        self.print_value(arg, pretty=True)
+
+    def do_more(self, arg):
+        """more
+        Print the next page of the value last printed by p or pp.
+        """
+        if self.pager is None:
+            self.write('*** Nothing more to print.')
+            return
+        try:
+            page = self.pager.get_page()
+        except Exception:
+            # e.g. a container whose __iter__ or __len__ raises.
+            self.write_exception()
+            return
+        self.write(page)
+        if self.pager.exhausted:
+            self.pager = None
+        else:
+            self.write("... (say 'more' to see the next page)")
 
     def do_continue(self, arg):
         """Clean-up and do underlying continue."""
@@ -150,24 +437,195 @@ class Ircpdb(pdb.Pdb):
     do_q = do_exit = do_quit
 
 
+class SnapshotDebugger(Ircpdb):
+    """Serves read-only pdb commands against a `Snapshot` of a stack.
+
+    The thread that took the snapshot carries on running; commands are
+    answered on a thread of our own until somebody says ``continue`` or
+    ``quit`` (or `activation_timeout` expires).
+    """
+    COMMANDS = {
+        'where': 'w bt', 'up': 'u', 'down': 'd', 'list': 'l',
+        'args': 'a', 'p': '', 'pp': '', 'continue': 'c cont',
+        'quit': 'q exit', 'help': 'h',
+    }
+
+    def __init__(self, snapshot, *args, **kwargs):
+        self.snapshot = snapshot
+        self.index = len(snapshot.frames) - 1
+        Ircpdb.__init__(self, *args, **kwargs)
+        self.allowed_commands = set(['EOF'])
+        for command, aliases in self.COMMANDS.items():
+            self.allowed_commands.add(command)
+            self.allowed_commands.update(aliases.split())
+
+    @property
+    def current(self):
+        return self.snapshot.frames[self.index]
+
+    def start(self):
+        """Start answering commands on a new thread."""
+        if self.bot is not None:
+            self.start_bot()
+        thread = Thread(target=self.serve, name='ircpdb-snapshot')
+        thread.daemon = True
+        thread.start()
+
+    def serve(self):
+        try:
+            self.write(
+                "Snapshot of thread %s taken at %s; it has continued "
+                "running, so only %s are available." % (
+                    self.snapshot.thread_name,
+                    time.strftime(
+                        '%Y-%m-%d %H:%M:%S',
+                        time.localtime(self.snapshot.created)
+                    ),
+                    ', '.join(sorted(self.COMMANDS)),
+                )
+            )
+            self.print_current()
+            self.cmdloop()
+        except Exception:
+            self.shutdown()
+            traceback.print_exc()
+
+    def preloop(self):
+        # pdb's `preloop` inspects the live frame for `display`s.
+        pass
+
+    def onecmd(self, line):
+        command, _, _ = self.parseline(line)
+        if command and command not in self.allowed_commands:
+            self.write(
+                '*** "%s" is not available for a snapshot.' % command
+            )
+            return False
+        return pdb.Pdb.onecmd(self, line)
+
+    def print_current(self):
+        self.write('> %s' % self.current.describe())
+        self.write('-> %s' % self.current.get_current_line())
+
+    def do_where(self, arg):
+        for index, frame in enumerate(self.snapshot.frames):
+            marker = '>' if index == self.index else ' '
+            self.write('%s %s' % (marker, frame.describe()))
+            self.write('-> %s' % frame.get_current_line())
+
+    do_w = do_bt = do_where
+
+    def do_up(self, arg):
+        if self.index == 0:
+            self.write('*** Oldest frame')
+            return
+        self.index -= 1
+        self.print_current()
+
+    do_u = do_up
+
+    def do_down(self, arg):
+        if self.index == len(self.snapshot.frames) - 1:
+            self.write('*** Newest frame')
+            return
+        self.index += 1
+        self.print_current()
+
+    do_d = do_down
+
+    def do_list(self, arg):
+        frame = self.current
+        for offset, line in enumerate(frame.source):
+            lineno = frame.source_start + offset
+            self.write(
+                '%4s %s\t%s' % (
+                    lineno,
+                    '->' if lineno == frame.lineno else '  ',
+                    line.rstrip(),
+                )
+            )
+
+    do_l = do_list
+
+    def do_args(self, arg):
+        for name in self.current.arguments:
+            self.write('%s = %s' % (name, self.current.names.get(name)))
+
+    do_a = do_args
+
+    def do_p(self, arg):
+        name = arg.strip()
+        if name not in self.current.names:
+            self.write(
+                "*** Only names captured in the snapshot can be printed; "
+                "'%s' wasn't." % name
+            )
+            return
+        self.write(self.current.names[name])
+
+    do_pp = do_p
+
+    def do_help(self, arg):
+        self.write(
+            'Available commands: %s' % ', '.join(
+                '%s (%s)' % (command, aliases) if aliases else command
+                for command, aliases in sorted(self.COMMANDS.items())
+            )
+        )
+
+    do_h = do_help
+
+    def do_continue(self, arg):
+        self.shutdown()
+        return 1
+
+    do_c = do_cont = do_continue
+
+    do_quit = do_q = do_exit = do_EOF = do_continue
+
+
 def set_trace(*args, **kwargs):
     """Wrapper function to keep the same import x; x.set_trace() interface.
 
     We catch all the possible exceptions from pdb and cleanup.
 
+    The `when`, `sample_rate`, `max_hits` and `cooldown` keyword
+    arguments make the breakpoint conditional (see
+    `ircpdb.conditions.should_break`); they're checked before anything
+    else is done, so a breakpoint that doesn't fire is cheap.
+
+    If `snapshot` is set, a `Snapshot` of the caller's stack is taken
+    and served by a `SnapshotDebugger`, and we return immediately
+    rather than stopping the caller.
+
     """
+    if kwargs:
+        conditions = {}
+        for name in CONDITIONS:
+            if name in kwargs:
+                conditions[name] = kwargs.pop(name)
+        if conditions and not should_break(
+            sys._getframe(1), **conditions
+        ):
+            return
     if not args and 'DEFAULT_IRCPDB_URI' in os.environ:
         args = (
             os.environ['DEFAULT_IRCPDB_URI'],
         )
+    if kwargs.pop('snapshot', False):
+        debugger = SnapshotDebugger(
+            Snapshot.capture(sys._getframe(1)), *args, **kwargs
+        )
+        try:
+            debugger.start()
+        except Exception:
+            debugger.shutdown()
+            traceback.print_exc()
+        return
     debugger = Ircpdb(*args, **kwargs)
     try:
-        irc_feeder = Thread(
-            target=debugger.bot.process_forever,
-            args=(debugger.b_B_pipe, debugger.b_A_pipe, ),
-        )
-        irc_feeder.daemon = True
-        irc_feeder.start()
+        if debugger.bot is not None:
+            debugger.start_bot()
 
         debugger.set_trace(sys._getframe().f_back)
     except Exception:
@@ -13,3 +13,7 @@ class NoAllowedNicknamesSelected(IrcpdbError, ValueError):
 
 class PasteError(IrcpdbError, IOError):
     pass
+
+
+class UnknownPasteBackend(IrcpdbError, ValueError):
+    pass
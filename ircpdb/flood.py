@@ -0,0 +1,119 @@
+import json
+import os
+import time
+
+from .utils import write_atomically
+
+
+DEFAULT_PROFILE_PATH = os.path.join(
+    os.path.expanduser('~'), '.ircpdb_flood.json'
+)
+
+
+class AdaptiveRate(object):
+    """Finds the fastest rate a server will accept messages at.
+
+    Starting from `rate` messages per second (after an initial `burst`),
+    the rate grows by `increase` -- and the burst by one, up to
+    `max_burst` -- for every `window` messages we've had to throttle
+    without the server complaining.  Both are multiplied by `decrease`
+    whenever it does complain (by disconnecting us for flooding, or by
+    lagging noticeably behind).  The rate is kept between `min_rate` and
+    `max_rate`.
+    """
+    def __init__(
+        self, rate, burst, min_rate=0.2, max_rate=10, increase=0.1,
+        decrease=0.5, window=10, max_burst=None
+    ):
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate = self.clamp(rate)
+        self.max_burst = max_burst or burst
+        self.burst = min(burst, self.max_burst)
+        self.increase = increase
+        self.decrease = decrease
+        self.window = window
+        self.throttled = 0
+        self.penalties = 0
+
+    def clamp(self, rate):
+        return min(max(rate, self.min_rate), self.max_rate)
+
+    def on_throttled_send(self):
+        """Record a message sent after waiting for the throttle.
+
+        Returns `True` if the rate or burst was increased.
+        """
+        self.throttled += 1
+        if self.throttled < self.window:
+            return False
+        self.throttled = 0
+        rate = self.clamp(self.rate + self.increase)
+        burst = min(self.burst + 1, self.max_burst)
+        increased = rate > self.rate or burst > self.burst
+        self.rate = rate
+        self.burst = burst
+        return increased
+
+    def on_penalty(self):
+        self.penalties += 1
+        self.throttled = 0
+        self.rate = self.clamp(self.rate * self.decrease)
+        self.burst = max(int(self.burst * self.decrease), 1)
+
+
+class LagMonitor(object):
+    """Tracks the round-trip time of our PINGs to the server.
+
+    A server that's holding back our messages because we're sending
+    them too quickly answers PINGs late, too; the round trip is
+    considered to be lagging once it exceeds the smallest round trip
+    seen by `factor` times, plus `slack` seconds.
+    """
+    def __init__(self, factor=3, slack=1.0, clock=time.time):
+        self.factor = factor
+        self.slack = slack
+        self.clock = clock
+        self.pending = {}
+        self.baseline = None
+        self.last = None
+
+    def start(self, token):
+        self.pending[token] = self.clock()
+
+    def finish(self, token):
+        """Record the PONG for `token`; returns `True` if we're lagging."""
+        started = self.pending.pop(token, None)
+        if started is None:
+            return False
+        self.last = self.clock() - started
+        if self.baseline is None or self.last < self.baseline:
+            self.baseline = self.last
+        return self.last > self.baseline * self.factor + self.slack
+
+
+class FloodProfiles(object):
+    """The send rate and burst learned for each server, stored as JSON."""
+    def __init__(self, path=DEFAULT_PROFILE_PATH):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as in_:
+                return json.load(in_)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def get(self, server):
+        return self.load().get(server)
+
+    def set(self, server, rate, burst):
+        profiles = self.load()
+        profiles[server] = {
+            'rate': rate,
+            'burst': burst,
+            'updated': time.time(),
+        }
+        write_atomically(
+            self.path, json.dumps(profiles, indent=2, sort_keys=True)
+        )
@@ -0,0 +1,322 @@
+"""A long-lived process sharing one IRC connection between many debuggers.
+
+Rather than each call to `ircpdb.set_trace` connecting to IRC on its
+own, debuggers started with the ``hub`` parameter attach to a running
+hub over a Unix socket.  Each attached debugger becomes a numbered
+session in the hub's channel; prefix a command with a session's number
+(e.g. ``!3 bt``) to direct it to that session.
+
+Start a hub using::
+
+    python -m ircpdb.hub \
+        'irc+ssl://hub@irc.mycompany.org/#debug?limit_access_to=me'
+
+"""
+import argparse
+from collections import OrderedDict
+import errno
+import functools
+import json
+import logging
+import os
+import re
+import socket
+import tempfile
+
+from .bot import IrcpdbBot
+from .debugger import create_bot, get_params
+from .exceptions import IrcpdbError
+from .reader import FrameReader
+
+
+logger = logging.getLogger(__name__)
+
+
+# Whoever is listening on the hub's socket gets a debugger prompt in
+# every process attaching to it, so the socket lives in a directory
+# only its user can access.
+DEFAULT_SOCKET_PATH = os.path.join(
+    os.environ.get('XDG_RUNTIME_DIR') or os.path.join(
+        tempfile.gettempdir(), 'ircpdb-%s' % os.getuid()
+    ),
+    'ircpdb.sock',
+)
+
+
+def get_private_directory(path):
+    """Create the directory `path` unless it exists, and make sure only
+    we have access to it."""
+    if not os.path.isdir(path):
+        os.makedirs(path, 0o700)
+    stat = os.stat(path)
+    if stat.st_uid != os.getuid() or stat.st_mode & 0o077:
+        raise IrcpdbError(
+            "%s must belong to, and only be accessible by, the user "
+            "running the hub." % path
+        )
+    return path
+
+
+class HubSession(object):
+    """A debugger attached to the hub."""
+    # Debuggers introduce themselves with a single line of JSON; give up
+    # on anything that doesn't look like one.
+    MAX_HELLO_BYTES = 4096
+
+    def __init__(self, number, connection, max_frame_bytes=None):
+        self.number = number
+        self.connection = connection
+        self.reader = FrameReader(
+            connection.fileno(),
+            max_frame_bytes=max_frame_bytes,
+        )
+        self.info = None
+        self.hello_buffer = b''
+        self.activated = False
+        self.closed = False
+
+    def describe(self):
+        info = self.info or {}
+        return 'host %s, pid %s, thread %s' % (
+            info.get('host', '?'),
+            info.get('pid', '?'),
+            info.get('thread', '?'),
+        )
+
+    def read(self):
+        try:
+            data = self.connection.recv(self.reader.block_size)
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return []
+            data = b''
+        if not data:
+            return self.reader.finish()
+
+        if self.info is None:
+            self.hello_buffer += data
+            hello, newline, data = self.hello_buffer.partition(b'\n')
+            if not newline:
+                if len(self.hello_buffer) > self.MAX_HELLO_BYTES:
+                    return self.reader.finish()
+                return []
+            self.hello_buffer = b''
+            try:
+                self.info = json.loads(hello.decode('utf-8'))
+            except ValueError:
+                self.info = {}
+        return self.reader.feed(data)
+
+    def send(self, command):
+        try:
+            self.connection.sendall((u'%s\n' % command).encode('utf-8'))
+        except socket.error as e:
+            logger.warning(
+                'Unable to send command to session %s: %s', self.number, e
+            )
+
+    def close(self):
+        self.closed = True
+        self.connection.close()
+
+
+class HubBot(IrcpdbBot):
+    SESSION_COMMAND = re.compile(r'^(\d+)\s+(.*)$')
+    SUPPORTS_BATCHES = False
+
+    def __init__(self, *args, **kwargs):
+        super(HubBot, self).__init__(*args, **kwargs)
+        self.sessions = OrderedDict()
+        self.next_session_number = 1
+        self.listener = None
+
+    def get_greeting(self):
+        greeting = super(HubBot, self).get_greeting()
+        greeting[0] = "Debugger hub ready (on host %s)" % (
+            socket.gethostname()
+        )
+        greeting.append(
+            "Prefix commands with a session number (e.g. '!3 bt') when "
+            "more than one session is attached; say '!!sessions' for a "
+            "list of attached sessions."
+        )
+        return greeting
+
+    def serve(self, path=DEFAULT_SOCKET_PATH):
+        get_private_directory(os.path.dirname(os.path.abspath(path)))
+        if os.path.exists(path):
+            os.unlink(path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Debuggers trust whoever is listening here with their prompt
+        # (see `DEFAULT_SOCKET_PATH`); nobody else should be able to
+        # attach to it either, even between `bind` and a `chmod`.
+        umask = os.umask(0o177)
+        try:
+            self.listener.bind(path)
+        finally:
+            os.umask(umask)
+        self.listener.listen(128)
+        self.add_reader(self.listener, self.on_accept)
+        self.attached = True
+        logger.info('ircpdb hub listening on %s', path)
+        try:
+            self.run()
+        finally:
+            for session in list(self.sessions.values()):
+                session.close()
+            self.listener.close()
+            os.unlink(path)
+
+    def on_accept(self):
+        try:
+            connection, _ = self.listener.accept()
+        except socket.error:
+            return
+        session = HubSession(
+            self.next_session_number,
+            connection,
+            max_frame_bytes=self.max_response_bytes,
+        )
+        self.next_session_number += 1
+        self.sessions[session.number] = session
+        self.add_reader(
+            connection, functools.partial(self.on_session_output, session)
+        )
+        self.reactor.execute_delayed(
+            self.activation_timeout,
+            self.on_session_activation_timeout,
+            (session, ),
+        )
+
+    def on_session_output(self, session):
+        announce = session.info is None
+        frames = session.read()
+        if announce and session.info is not None:
+            self.send_channel_message(
+                "Session %s attached (%s)." % (
+                    session.number, session.describe()
+                )
+            )
+        for message, complete in frames:
+            stripped = message.strip()
+            if stripped:
+                logger.debug('>> [%s] %s', session.number, stripped)
+                self.send_channel_message(
+                    u'[%s] %s' % (session.number, stripped)
+                )
+        if any(complete for _, complete in frames):
+            self.send_session_prompt(session)
+        if session.reader.eof:
+            self.end_session(session)
+
+    def end_session(self, session):
+        self.remove_reader(session.connection)
+        self.sessions.pop(session.number, None)
+        session.close()
+        self.send_channel_message("Session %s ended." % session.number)
+
+    def on_session_activation_timeout(self, session):
+        if session.closed or session.activated:
+            return
+        self.send_channel_message(
+            "No response received for session %s within %s seconds; "
+            "continuing." % (session.number, self.activation_timeout)
+        )
+        session.send('continue')
+
+    def send_prompt(self):
+        for session in self.sessions.values():
+            self.send_session_prompt(session)
+
+    def send_session_prompt(self, session):
+        if not self.joined:
+            return
+        self.send_lines(
+            self.get_channel_target(),
+            '%s (session %s)' % (self.PROMPT, session.number),
+            command='ACTION',
+        )
+
+    def continue_debugger(self):
+        for session in self.sessions.values():
+            session.send('continue')
+
+    def do_command(self, e, cmd):
+        if cmd.startswith('!sessions') and self.is_allowed(
+            e.source.nick, e.target
+        ):
+            self.send_channel_message(
+                [
+                    'Session %s: %s' % (number, session.describe())
+                    for number, session in self.sessions.items()
+                ] or ['No sessions are attached.'],
+                paste=False,
+            )
+            return
+        super(HubBot, self).do_command(e, cmd)
+
+    def send_command(self, command):
+        match = self.SESSION_COMMAND.match(command)
+        if match:
+            number = int(match.group(1))
+            command = match.group(2)
+            session = self.sessions.get(number)
+            if session is None:
+                self.send_channel_message(
+                    "There is no session %s; say '!!sessions' for a list "
+                    "of attached sessions." % number
+                )
+                return
+        elif len(self.sessions) == 1:
+            session = list(self.sessions.values())[0]
+        elif not self.sessions:
+            self.send_channel_message('No sessions are attached.')
+            return
+        else:
+            self.send_channel_message(
+                "%s sessions are attached; please prefix your command "
+                "with a session number (e.g. '!%s %s')." % (
+                    len(self.sessions),
+                    list(self.sessions)[0],
+                    command,
+                )
+            )
+            return
+        logger.debug('<< [%s] %s', session.number, command)
+        session.activated = True
+        session.send(command)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description=(
+            'Share a single IRC connection between many ircpdb debuggers.'
+        )
+    )
+    parser.add_argument(
+        'uri',
+        nargs='?',
+        default=os.environ.get('DEFAULT_IRCPDB_URI'),
+        help=(
+            'URI of the IRC server and channel to connect to; defaults to '
+            'the value of the DEFAULT_IRCPDB_URI environment variable.'
+        )
+    )
+    parser.add_argument(
+        '--socket',
+        default=DEFAULT_SOCKET_PATH,
+        help=(
+            'Path of the Unix socket debuggers should attach to. '
+            'Default: %(default)s'
+        )
+    )
+    parser.add_argument('--log-level', default='INFO')
+    options = parser.parse_args(args)
+
+    logging.basicConfig(level=getattr(logging, options.log_level.upper()))
+    bot = create_bot(get_params(options.uri), bot_class=HubBot)
+    bot.serve(options.socket)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+import json
+import os
+
+from .utils import write_atomically
+
+
+DEFAULT_MACRO_PATH = os.path.join(
+    os.path.expanduser('~'), '.ircpdb_macros.json'
+)
+
+
+class MacroStore(object):
+    """Sequences of debugger commands saved by name for each channel.
+
+    Macros are stored as JSON in the file at `path`, mapping each
+    channel to its macros' names and commands.  The file is re-read
+    before every lookup so that macros recorded in other sessions (or
+    processes) are available straight away.
+    """
+    def __init__(self, path=DEFAULT_MACRO_PATH):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as in_:
+                return json.load(in_)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def get_names(self, channel):
+        return sorted(self.load().get(channel, {}))
+
+    def get(self, channel, name):
+        return self.load().get(channel, {}).get(name)
+
+    def set(self, channel, name, commands):
+        macros = self.load()
+        macros.setdefault(channel, {})[name] = list(commands)
+        self.save(macros)
+
+    def save(self, macros):
+        write_atomically(
+            self.path, json.dumps(macros, indent=2, sort_keys=True)
+        )
@@ -0,0 +1,168 @@
+from bisect import bisect_left
+from collections import OrderedDict
+import json
+
+from .utils import write_atomically
+
+
+SECONDS_BUCKETS = (
+    0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60,
+)
+BYTES_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, )
+DEPTH_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500, )
+
+
+class Counter(object):
+    type = 'counter'
+
+    def __init__(self, description):
+        self.description = description
+        self.value = 0
+
+    def increment(self, amount=1):
+        self.value += amount
+
+    def summarize(self):
+        return '%s' % self.value
+
+    def as_dict(self):
+        return {'value': self.value}
+
+    def iter_samples(self, name):
+        yield name, self.value
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram(object):
+    """Counts observed values in buckets with the given upper bounds."""
+    type = 'histogram'
+
+    def __init__(self, description, buckets=SECONDS_BUCKETS):
+        self.description = description
+        self.buckets = tuple(buckets)
+        # The last count is of values above the largest bucket.
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def get_percentile(self, pct):
+        """Returns the upper bound of the bucket holding the percentile.
+
+        Returns the largest value observed if that's beyond the last
+        bucket, or `None` if nothing has been observed.
+        """
+        if not self.count:
+            return None
+        target = self.count * pct / 100.0
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def summarize(self):
+        if not self.count:
+            return 'no observations'
+        return 'count=%s mean=%.4g p50<=%.4g p95<=%.4g max=%.4g' % (
+            self.count,
+            float(self.sum) / self.count,
+            self.get_percentile(50),
+            self.get_percentile(95),
+            self.max,
+        )
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'max': self.max,
+            'buckets': [
+                [bound, count]
+                for bound, count in zip(self.get_bounds(), self.counts)
+            ],
+        }
+
+    def get_bounds(self):
+        return self.buckets + ('+Inf', )
+
+    def iter_samples(self, name):
+        cumulative = 0
+        for bound, count in zip(self.get_bounds(), self.counts):
+            cumulative += count
+            yield '%s_bucket{le="%s"}' % (name, bound), cumulative
+        yield '%s_sum' % name, self.sum
+        yield '%s_count' % name, self.count
+
+
+class Metrics(object):
+    """The counters, gauges and histograms describing a bot's session.
+
+    `definitions` is a list of ``(name, metric)`` tuples.  Metrics are
+    only ever updated from the bot's thread.
+    """
+    PREFIX = 'ircpdb_'
+
+    def __init__(self, definitions):
+        self.metrics = OrderedDict(definitions)
+
+    def increment(self, name, amount=1):
+        self.metrics[name].increment(amount)
+
+    def set(self, name, value):
+        self.metrics[name].set(value)
+
+    def observe(self, name, value):
+        self.metrics[name].observe(value)
+
+    def summarize(self):
+        """Returns a line describing each metric, for display on IRC."""
+        return [
+            '%s: %s' % (name, metric.summarize())
+            for name, metric in self.metrics.items()
+        ]
+
+    def as_json(self):
+        return json.dumps(
+            OrderedDict(
+                (name, dict(metric.as_dict(), type=metric.type))
+                for name, metric in self.metrics.items()
+            ),
+            indent=2,
+        )
+
+    def as_prometheus(self):
+        lines = []
+        for name, metric in self.metrics.items():
+            name = self.PREFIX + name
+            lines.append('# HELP %s %s' % (name, metric.description))
+            lines.append('# TYPE %s %s' % (name, metric.type))
+            for sample, value in metric.iter_samples(name):
+                lines.append('%s %s' % (sample, value))
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        """Write every metric to `path`.
+
+        Metrics are written in Prometheus' text format if `path` ends
+        with ``.prom``, and as JSON otherwise.
+        """
+        if path.endswith('.prom'):
+            content = self.as_prometheus()
+        else:
+            content = self.as_json()
+        write_atomically(path, content)
@@ -0,0 +1,83 @@
+from collections import deque
+import re
+
+
+class OutputPager(object):
+    """Holds on to the debugger's recent output so it can be paged through.
+
+    Only the first `page_lines` lines of each response are sent right
+    away; the rest wait here until somebody asks for them.  At most
+    `buffer_lines` lines of output (spanning as many responses as fit)
+    are kept, the oldest being discarded first.
+    """
+    def __init__(self, page_lines, buffer_lines=1000):
+        self.page_lines = page_lines
+        self.lines = deque(maxlen=buffer_lines)
+        # Positions below are counted from the first line ever added,
+        # so they stay meaningful as old lines fall out of `lines`.
+        self.total = 0
+        self.response_start = 0
+        self.position = 0
+        self.response_complete = True
+
+    def get_line(self, position):
+        index = position - (self.total - len(self.lines))
+        if index < 0:
+            return None
+        return self.lines[index]
+
+    def add(self, lines):
+        """Buffer `lines` of output, returning those to be sent now."""
+        if self.response_complete:
+            self.response_start = self.position = self.total
+            self.response_complete = False
+        self.lines.extend(lines)
+        self.total += len(lines)
+        send = []
+        page_end = self.response_start + self.page_lines
+        while self.position < min(page_end, self.total):
+            send.append(self.get_line(self.position))
+            self.position += 1
+        return send
+
+    def finish(self):
+        """Mark the end of a response.
+
+        Returns the number of its lines that haven't been sent yet.
+        """
+        self.response_complete = True
+        return self.get_remaining()
+
+    def get_remaining(self):
+        return self.total - self.position
+
+    def get_more(self):
+        """Returns the next page of the latest response."""
+        start = max(self.position, self.total - len(self.lines))
+        end = min(start + self.page_lines, self.total)
+        self.position = end
+        return [self.get_line(position) for position in range(start, end)]
+
+    def get_page_count(self):
+        return max(
+            -(-(self.total - self.response_start) // self.page_lines), 1
+        )
+
+    def get_page(self, number):
+        """Returns page `number` (counting from 1) of the latest response.
+
+        Returns `None` if there's no such page, or it has been discarded.
+        """
+        start = self.response_start + (number - 1) * self.page_lines
+        end = min(start + self.page_lines, self.total)
+        if number < 1 or start >= self.total:
+            return None
+        if start < self.total - len(self.lines):
+            return None
+        self.position = max(self.position, end)
+        return [self.get_line(position) for position in range(start, end)]
+
+    def grep(self, pattern):
+        """Returns every buffered line matching the regular expression."""
+        expression = re.compile(pattern)
+        return [line for line in self.lines if expression.search(line)]
@@ -7,14 +7,38 @@ from six.moves.urllib.parse import (
     unquote
 )
 
-from .utils import comma_separated_list
+from .utils import boolean, comma_separated_list
 
 
 PARAMS = {
     'message_wait_seconds': float,
+    'message_burst': int,
+    'pack_lines': boolean,
+    'diff_mode': boolean,
+    'abort_batch_on_error': boolean,
     'paste_minimum_response_length': int,
+    'paste_timeout': float,
+    'paste_cache_size': int,
+    'paste_cache_ttl': float,
+    'paste_port': int,
     'limit_access_to': comma_separated_list,
+    'mirror_channels': comma_separated_list,
+    'multiline': boolean,
+    'shutdown_timeout': float,
     'activation_timeout': float,
+    'max_response_bytes': int,
+    'metrics_interval': float,
+    'adaptive_flood_control': boolean,
+    'lag_check_seconds': float,
+    'reconnect_min_seconds': float,
+    'reconnect_max_seconds': float,
+    'reconnect_deadline': float,
+    'reconnect_buffer_messages': int,
+    'repr_max_depth': int,
+    'repr_max_items': int,
+    'repr_max_bytes': int,
+    'pager_lines': int,
+    'pager_buffer_lines': int,
 }
 
 
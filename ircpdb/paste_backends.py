@@ -1,18 +1,98 @@
 import abc
+import codecs
 import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import uuid
 
 import requests
+from requests.adapters import HTTPAdapter
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
+
+from .exceptions import UnknownPasteBackend
+
+
+logger = logging.getLogger(__name__)
+
+
+# Paste backends selectable by name using the `paste_backend` parameter;
+# backends provided by other packages are found via this entry point group.
+BACKENDS = {}
+ENTRY_POINT_GROUP = 'ircpdb.paste_backends'
 
 
 class PasteBackend(object):
     __metaclass__ = abc.ABCMeta
 
+    # Whether URLs returned by this backend remain valid after the
+    # debugging session has ended (and so may be stored in the paste cache).
+    cacheable = True
+
+    @classmethod
+    def from_params(cls, params):
+        """Create an instance of this backend from debugger parameters.
+
+        Backends having their own options should override this to read
+        them from `params`; any query string argument of the debugger's
+        URI will be available here.
+        """
+        return cls(timeout=params.get('paste_timeout'))
+
+    def __init__(self, timeout=None, pool_size=2):
+        """
+        :type timeout: float
+        :param timeout: Number of seconds to wait for the pastebin to
+            respond before giving up.
+        :type pool_size: int
+        :param pool_size: Maximum number of connections to keep open
+            to the pastebin.
+        """
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        """A `requests.Session` whose connections are reused between pastes.
+
+        The session is created the first time it's needed and lives until
+        `close` is called.
+        """
+        with self._session_lock:
+            if self._session is None:
+                self._session = self.create_session()
+            return self._session
+
+    def create_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_size,
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def close(self):
+        """Close any connections held open to the pastebin."""
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
     @abc.abstractmethod
     def paste(self, output):
         """Paste output to your pastebin of choice.
 
-        :type output: list of basestring
-        :param output: The output lines we'd like sent to the pastebin.
+        :type output: iterable of basestring
+        :param output: The output lines we'd like sent to the pastebin;
+            this may be a generator, so backends should avoid building
+            the complete paste in memory where possible.
         :rtype: string
         :returns: URL to return to the shell.
         """
@@ -20,17 +100,193 @@ class PasteBackend(object):
 
 
 class GistBackend(PasteBackend):
+    URL = 'https://api.github.com/gists'
+
+    @classmethod
+    def from_params(cls, params):
+        return cls(
+            url=params.get('paste_url'),
+            timeout=params.get('paste_timeout'),
+        )
+
+    def __init__(self, url=None, **kwargs):
+        super(GistBackend, self).__init__(**kwargs)
+        self.url = url or self.URL
+
+    # Lines are collected into chunks of roughly this many bytes before
+    # being sent to the API.
+    CHUNK_SIZE = 65536
+
+    def iter_payload(self, lines):
+        """Generate the JSON request body for pasting `lines`.
+
+        This is the same document `json.dumps` would produce, but built a
+        chunk at a time so that it can be sent using chunked
+        transfer-encoding without ever holding the whole paste in memory.
+        """
+        chunk = [b'{"files": {"output.txt": {"content": "']
+        chunk_length = 0
+        for index, line in enumerate(lines):
+            if index:
+                chunk.append(b'\\n')
+            # Strip the quotes `json.dumps` wraps strings in.
+            encoded = json.dumps(line)[1:-1].encode('utf-8')
+            chunk.append(encoded)
+            chunk_length += len(encoded)
+            if chunk_length >= self.CHUNK_SIZE:
+                yield b''.join(chunk)
+                chunk = []
+                chunk_length = 0
+        chunk.append(b'"}}}')
+        yield b''.join(chunk)
+
     def paste(self, lines):
-        response = requests.post(
-            'https://api.github.com/gists',
-            data=json.dumps(
-                {
-                    'files': {
-                        'output.txt': {
-                            'content': '\n'.join(lines)
-                        }
-                    }
-                }
-            )
+        response = self.session.post(
+            self.url,
+            data=self.iter_payload(lines),
+            headers={'Content-Type': 'application/json'},
+            timeout=self.timeout,
         )
         return response.json()['html_url']
+
+
+class LocalPasteHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        name = os.path.basename(self.path.split('?', 1)[0])
+        path = os.path.join(self.server.directory, name)
+        if not name or not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, 'rb') as in_:
+            content = in_.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+class LocalPasteServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, directory):
+        HTTPServer.__init__(self, address, LocalPasteHandler)
+        self.directory = directory
+
+
+class LocalBackend(PasteBackend):
+    """Writes pastes to files in a local directory.
+
+    If `url` is specified, it should be the URL at which `directory` is
+    already being served (e.g. by an internal static file server);
+    otherwise, a small HTTP server is started in-process for serving
+    pastes for the duration of the debugging session.
+    """
+    @classmethod
+    def from_params(cls, params):
+        return cls(
+            directory=params.get('paste_dir'),
+            url=params.get('paste_url'),
+            port=params.get('paste_port') or 0,
+            timeout=params.get('paste_timeout'),
+        )
+
+    def __init__(self, directory=None, url=None, port=0, **kwargs):
+        super(LocalBackend, self).__init__(**kwargs)
+        self.directory = directory
+        self.url = url
+        self.port = port
+        self.server = None
+        self._server_lock = threading.Lock()
+        # Pastes served by our in-process server disappear once it stops.
+        self.cacheable = bool(url)
+
+    def get_directory(self):
+        if self.directory is None:
+            self.directory = tempfile.mkdtemp(prefix='ircpdb-')
+        elif not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        return self.directory
+
+    def get_base_url(self):
+        if self.url:
+            return self.url.rstrip('/') + '/'
+        with self._server_lock:
+            if self.server is None:
+                self.server = LocalPasteServer(
+                    ('', self.port), self.get_directory()
+                )
+                thread = threading.Thread(target=self.server.serve_forever)
+                thread.daemon = True
+                thread.start()
+        return 'http://%s:%s/' % (
+            socket.getfqdn(),
+            self.server.server_address[1],
+        )
+
+    def paste(self, lines):
+        name = '%s.txt' % uuid.uuid4().hex
+        path = os.path.join(self.get_directory(), name)
+        with codecs.open(path, 'w', encoding='utf-8') as out:
+            for index, line in enumerate(lines):
+                if index:
+                    out.write(u'\n')
+                out.write(line)
+        return self.get_base_url() + name
+
+    def close(self):
+        super(LocalBackend, self).close()
+        with self._server_lock:
+            if self.server is not None:
+                self.server.shutdown()
+                self.server.server_close()
+                self.server = None
+
+
+def register_backend(name, backend_class):
+    """Make `backend_class` selectable using ``paste_backend=<name>``."""
+    BACKENDS[name] = backend_class
+
+
+def iter_entry_points():
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        try:
+            import pkg_resources
+        except ImportError:
+            return []
+        return pkg_resources.iter_entry_points(ENTRY_POINT_GROUP)
+    all_entry_points = entry_points()
+    if hasattr(all_entry_points, 'select'):
+        return all_entry_points.select(group=ENTRY_POINT_GROUP)
+    return all_entry_points.get(ENTRY_POINT_GROUP, [])
+
+
+def get_backend_class(name):
+    if name not in BACKENDS:
+        for entry_point in iter_entry_points():
+            if entry_point.name == name:
+                register_backend(name, entry_point.load())
+                break
+        else:
+            raise UnknownPasteBackend(
+                "No paste backend named '%s' is available; choose from "
+                "%s or register one using the '%s' entry point group." % (
+                    name,
+                    ', '.join(sorted(BACKENDS)),
+                    ENTRY_POINT_GROUP,
+                )
+            )
+    return BACKENDS[name]
+
+
+def get_backend(name, params):
+    return get_backend_class(name).from_params(params)
+
+
+register_backend('gist', GistBackend)
+register_backend('local', LocalBackend)
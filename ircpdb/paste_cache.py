@@ -0,0 +1,76 @@
+from collections import OrderedDict
+import hashlib
+import json
+import time
+
+from .utils import write_atomically
+
+
+class PasteCache(object):
+    """LRU cache mapping pasted output to the URL it was pasted to.
+
+    Entries are keyed by a hash of the pasted lines, so identical output
+    (e.g. repeated ``bt`` or ``!!help`` responses) can be answered with
+    the URL of the earlier paste rather than by pasting it again.  If
+    `path` is specified, the cache is loaded from and saved to that file
+    so sessions on the same host can share it.
+    """
+    def __init__(self, size=128, ttl=3600, path=None, clock=time.time):
+        self.size = size
+        self.ttl = ttl
+        self.path = path
+        self.clock = clock
+        self.entries = OrderedDict()
+        if self.path:
+            self.load()
+
+    @staticmethod
+    def get_key(lines):
+        digest = hashlib.sha1()
+        for line in lines:
+            digest.update(line.encode('utf-8'))
+            digest.update(b'\n')
+        return digest.hexdigest()
+
+    def is_expired(self, created):
+        return bool(self.ttl) and self.clock() > created + self.ttl
+
+    def get(self, key):
+        try:
+            url, created = self.entries.pop(key)
+        except KeyError:
+            return None
+        if self.is_expired(created):
+            return None
+        # Re-inserting marks this entry as the most recently used.
+        self.entries[key] = (url, created, )
+        return url
+
+    def set(self, key, url):
+        self.entries.pop(key, None)
+        self.entries[key] = (url, self.clock(), )
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+        if self.path:
+            self.save()
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as in_:
+                entries = json.load(in_)
+        except (IOError, OSError, ValueError):
+            return
+        for key, url, created in entries:
+            if not self.is_expired(created):
+                self.entries[key] = (url, created, )
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def save(self):
+        write_atomically(
+            self.path,
+            json.dumps([
+                [key, url, created]
+                for key, (url, created) in self.entries.items()
+            ]),
+        )
@@ -0,0 +1,118 @@
+import errno
+import os
+
+
+class FrameReader(object):
+    """Incrementally splits pdb's output into frames ending at its prompt.
+
+    Data is read from the raw file descriptor `fd` in blocks of at most
+    `block_size` bytes and accumulated in a buffer until pdb's `prompt`
+    is found in it, at which point everything before the prompt is
+    emitted as a complete frame.  A prompt split across two reads is
+    handled correctly, since the buffer is searched as a whole.
+
+    So that large responses can start making their way to IRC before pdb
+    has finished writing them, once more than `flush_bytes` have been
+    buffered without a prompt, everything up to the last newline is
+    emitted as a partial frame.  Frames are limited to `max_frame_bytes`
+    bytes (zero for unlimited); anything beyond that is discarded and
+    replaced by a marker when the frame completes.
+    """
+    def __init__(
+        self, fd, prompt=b'(Pdb)', block_size=65536,
+        flush_bytes=65536, max_frame_bytes=1048576
+    ):
+        self.fd = fd
+        self.prompt = prompt
+        self.block_size = block_size
+        self.flush_bytes = flush_bytes
+        self.max_frame_bytes = max_frame_bytes
+        self.buffer = b''
+        # Bytes of the current frame that were already emitted as
+        # partial frames, and bytes of it that were discarded.
+        self.frame_bytes = 0
+        self.truncated_bytes = 0
+        self.eof = False
+        # The number of bytes returned by the most recent read.
+        self.last_read = 0
+
+    def read(self):
+        """Read a block from `fd` and return any frames it completes.
+
+        Returns a list of ``(text, complete)`` tuples; `complete` is
+        `True` if pdb displayed its prompt after `text`.  `eof` is set
+        once pdb has closed its end of the pipe.
+        """
+        self.last_read = 0
+        try:
+            data = os.read(self.fd, self.block_size)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return []
+            if e.errno == errno.EBADF:
+                # pdb's side closed the pipe out from under us while
+                # shutting down.
+                return self.finish()
+            raise
+        if not data:
+            return self.finish()
+        self.last_read = len(data)
+        return self.feed(data)
+
+    def finish(self):
+        """Mark the end of pdb's output, returning any remaining output."""
+        self.eof = True
+        frames = []
+        if self.buffer or self.truncated_bytes:
+            # pdb won't be displaying a prompt after this output.
+            text, _ = self.emit(self.buffer, True)
+            frames.append((text, False, ))
+        self.buffer = b''
+        return frames
+
+    def feed(self, data):
+        self.buffer += data
+        frames = []
+        while True:
+            index = self.buffer.find(self.prompt)
+            if index == -1:
+                break
+            frames.append(self.emit(self.buffer[:index], True))
+            self.buffer = self.buffer[index + len(self.prompt):]
+
+        if self.max_frame_bytes:
+            # Anything but the last few bytes of the buffer can't be part
+            # of a partially-received prompt, so can be emitted (or
+            # discarded) right away rather than buffered.
+            settled = len(self.buffer) - (len(self.prompt) - 1)
+            if settled > 0 and (
+                self.frame_bytes + settled > self.max_frame_bytes
+            ):
+                frame = self.emit(self.buffer[:settled], False)
+                if frame[0]:
+                    frames.append(frame)
+                self.buffer = self.buffer[settled:]
+
+        if len(self.buffer) > self.flush_bytes:
+            newline = self.buffer.rfind(b'\n')
+            if newline != -1:
+                frames.append(self.emit(self.buffer[:newline + 1], False))
+                self.buffer = self.buffer[newline + 1:]
+        return frames
+
+    def emit(self, data, complete):
+        if self.max_frame_bytes:
+            allowed = max(self.max_frame_bytes - self.frame_bytes, 0)
+            if len(data) > allowed:
+                self.truncated_bytes += len(data) - allowed
+                data = data[:allowed]
+        text = data.decode('utf-8', 'replace')
+        self.frame_bytes += len(data)
+        if complete:
+            if self.truncated_bytes:
+                text += u'\n... (%s bytes of output truncated)' % (
+                    self.truncated_bytes
+                )
+            self.frame_bytes = 0
+            self.truncated_bytes = 0
+        return (text, complete, )
@@ -0,0 +1,189 @@
+from collections import deque
+try:
+    from collections.abc import Mapping, Sequence, Set
+except ImportError:
+    from collections import Mapping, Sequence, Set
+
+import six
+from six.moves import reprlib
+
+from .utils import get_byte_length
+
+
+class BoundedRenderer(object):
+    """Renders objects' reprs piece by piece, with limits on their size.
+
+    Rather than building a complete repr up-front, `iter_tokens` yields
+    it a piece at a time, so callers can stop as soon as they've got
+    enough output.  Built-in containers, and other mappings, sequences
+    and sets (prefixed with their type's name), are rendered item by
+    item; they are abbreviated once nested more than `max_depth` deep,
+    and only their first `max_items` items are shown.  Anything else is
+    rendered by `reprlib`, with strings and other reprs limited to
+    `max_bytes`.
+
+    If `pretty` is set, each item of a container too long for one line
+    is rendered on a line of its own, indented much as `pprint` would.
+    """
+    CONTAINERS = {
+        dict: ('{', '}', ),
+        list: ('[', ']', ),
+        tuple: ('(', ')', ),
+        set: ('{', '}', ),
+        frozenset: ('frozenset({', '})', ),
+        deque: ('deque([', '])', ),
+    }
+    # Brackets for containers of other types, checked in order.
+    ABSTRACT_CONTAINERS = (
+        (Mapping, ('{', '}', )),
+        (Set, ('{', '}', )),
+        (Sequence, ('[', ']', )),
+    )
+    # Sequences whose reprs aren't lists of their items.
+    ATOMIC_SEQUENCES = six.string_types + (
+        six.binary_type, bytearray, six.moves.range,
+    )
+    INDENT = '  '
+    # Containers whose reprs fit on a line this wide aren't split over
+    # several lines when `pretty` is set.
+    WIDTH = 79
+
+    def __init__(
+        self, max_depth=4, max_items=100, max_bytes=4096, pretty=False
+    ):
+        self.max_depth = max_depth
+        self.max_items = max_items
+        self.pretty = pretty
+        self.repr = reprlib.Repr()
+        self.repr.maxlevel = 1
+        for attr in (
+            'maxtuple', 'maxlist', 'maxarray', 'maxdict', 'maxset',
+            'maxfrozenset', 'maxdeque',
+        ):
+            setattr(self.repr, attr, max_items)
+        self.repr.maxstring = self.repr.maxlong = self.repr.maxother = (
+            max_bytes
+        )
+
+    def get_brackets(self, obj):
+        """Returns the opening and closing brackets of `obj`'s repr, or
+        `None` if it isn't rendered item by item."""
+        brackets = self.CONTAINERS.get(type(obj))
+        if brackets is not None:
+            return brackets
+        if isinstance(obj, self.ATOMIC_SEQUENCES) or hasattr(obj, '_fields'):
+            # Strings, named tuples and the like.
+            return None
+        for base, (opening, closing) in self.ABSTRACT_CONTAINERS:
+            if isinstance(obj, base):
+                return (
+                    '%s(%s' % (type(obj).__name__, opening),
+                    '%s)' % closing,
+                )
+        return None
+
+    def iter_tokens(self, obj, level=0):
+        brackets = self.get_brackets(obj)
+        if brackets is None:
+            yield self.repr.repr(obj)
+            return
+        opening, closing = brackets
+        if not obj:
+            yield repr(obj)
+            return
+        if level >= self.max_depth:
+            yield '%s...%s' % (opening, closing)
+            return
+
+        if self.pretty:
+            compact = self.get_compact(obj, level)
+            if compact is not None:
+                yield compact
+                return
+
+        yield opening
+        is_mapping = isinstance(obj, Mapping)
+        items = iter(obj.items()) if is_mapping else iter(obj)
+        for index, item in enumerate(items):
+            if index:
+                yield ','
+                if not self.pretty:
+                    yield ' '
+            if self.pretty:
+                yield '\n' + self.INDENT * (level + 1)
+            if index >= self.max_items:
+                yield '... (%s more)' % (len(obj) - index)
+                break
+            if is_mapping:
+                key, item = item
+                yield self.repr.repr(key)
+                yield ': '
+            for token in self.iter_tokens(item, level + 1):
+                yield token
+        if type(obj) is tuple and len(obj) == 1:
+            yield ','
+        if self.pretty:
+            yield '\n' + self.INDENT * level
+        yield closing
+
+    def get_compact(self, obj, level):
+        """Returns `obj`'s repr if it fits on what's left of a line."""
+        pretty, self.pretty = self.pretty, False
+        try:
+            width = self.WIDTH - len(self.INDENT) * level
+            tokens = []
+            length = 0
+            for token in self.iter_tokens(obj, level):
+                length += len(token)
+                if length > width:
+                    return None
+                tokens.append(token)
+            return ''.join(tokens)
+        finally:
+            self.pretty = pretty
+
+
+class Pager(object):
+    """Hands out pages of at most about `max_bytes` bytes of `tokens`.
+
+    Tokens are only consumed from the iterator as each page is
+    requested.
+    """
+    def __init__(self, tokens, max_bytes):
+        self.tokens = iter(tokens)
+        self.max_bytes = max_bytes
+        self.pending = None
+        self.exhausted = False
+
+    def get_page(self):
+        page = []
+        length = 0
+        while length < self.max_bytes:
+            if self.pending is not None:
+                token, self.pending = self.pending, None
+            else:
+                try:
+                    token = next(self.tokens)
+                except StopIteration:
+                    self.exhausted = True
+                    break
+                except RuntimeError as e:
+                    # e.g. a dictionary changed size while we were
+                    # iterating over it.
+                    self.exhausted = True
+                    page.append(' ... (%s)' % e)
+                    break
+            if page and length + get_byte_length(token) > self.max_bytes:
+                self.pending = token
+                break
+            page.append(token)
+            length += get_byte_length(token)
+        if not self.exhausted and self.pending is None:
+            # Find out whether there's anything left to show.
+            try:
+                self.pending = next(self.tokens)
+            except StopIteration:
+                self.exhausted = True
+            except RuntimeError:
+                pass
+        return ''.join(page)
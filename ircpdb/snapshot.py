@@ -0,0 +1,115 @@
+import inspect
+import linecache
+import threading
+import time
+
+from six.moves import reprlib
+
+
+class FrameSnapshot(object):
+    """The state of a single stack frame at the time it was captured."""
+    def __init__(
+        self, filename, lineno, function, source, source_start,
+        arguments, names
+    ):
+        self.filename = filename
+        self.lineno = lineno
+        self.function = function
+        # Lines of source surrounding `lineno`, the first of which is
+        # line number `source_start`.
+        self.source = source
+        self.source_start = source_start
+        # Names of the frame's arguments, and a mapping of every name
+        # we captured (locals, then any globals the code refers to) to
+        # the repr of its value.
+        self.arguments = arguments
+        self.names = names
+
+    def get_current_line(self):
+        try:
+            return self.source[self.lineno - self.source_start].strip()
+        except IndexError:
+            return ''
+
+    def describe(self):
+        """Returns this frame's location as pdb's ``where`` shows it."""
+        return '%s(%s)%s()' % (self.filename, self.lineno, self.function)
+
+
+class Snapshot(object):
+    """A bounded, read-only copy of a thread's stack.
+
+    Every value is stored as a repr limited in size by `repr_limits`, so
+    the snapshot stays small and never holds references to the objects
+    themselves; at most `max_frames` frames and `max_names` names per
+    frame are captured, along with `context` lines of source either side
+    of each frame's current line.
+    """
+    def __init__(self, frames, thread_name, created):
+        # Outermost frame first, as pdb orders its stack.
+        self.frames = frames
+        self.thread_name = thread_name
+        self.created = created
+
+    @classmethod
+    def capture(
+        cls, frame, max_frames=50, max_names=100, context=5,
+        repr_limits=None
+    ):
+        renderer = reprlib.Repr()
+        for attr, value in (repr_limits or {}).items():
+            setattr(renderer, attr, value)
+
+        frames = []
+        while frame is not None and len(frames) < max_frames:
+            frames.append(
+                cls.capture_frame(frame, renderer, max_names, context)
+            )
+            frame = frame.f_back
+        frames.reverse()
+        return cls(frames, threading.current_thread().name, time.time())
+
+    @classmethod
+    def capture_frame(cls, frame, renderer, max_names, context):
+        code = frame.f_code
+        lineno = frame.f_lineno
+        source_start = max(lineno - context, 1)
+        source = linecache.getlines(code.co_filename, frame.f_globals)[
+            source_start - 1:lineno + context
+        ]
+
+        names = {}
+        scopes = [
+            (frame.f_locals, list(frame.f_locals)),
+            # Rather than every global, capture only those the frame's
+            # code actually refers to.
+            (frame.f_globals, code.co_names),
+        ]
+        for scope, scope_names in scopes:
+            for name in scope_names:
+                if len(names) >= max_names:
+                    break
+                if name in names or name not in scope:
+                    continue
+                try:
+                    names[name] = renderer.repr(scope[name])
+                except Exception as e:
+                    names[name] = '<unrepresentable %s: %s>' % (
+                        type(scope[name]).__name__, e
+                    )
+
+        argument_count = code.co_argcount + getattr(
+            code, 'co_kwonlyargcount', 0
+        )
+        for flag in (inspect.CO_VARARGS, inspect.CO_VARKEYWORDS):
+            if code.co_flags & flag:
+                argument_count += 1
+        return FrameSnapshot(
+            filename=code.co_filename,
+            lineno=lineno,
+            function=code.co_name,
+            source=source,
+            source_start=source_start,
+            arguments=list(code.co_varnames[:argument_count]),
+            names=names,
+        )
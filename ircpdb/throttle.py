@@ -0,0 +1,95 @@
+import random
+import time
+
+
+class TokenBucket(object):
+    """Token bucket used for pacing messages sent to the IRC server.
+
+    The bucket holds at most ``burst`` tokens and is refilled at ``rate``
+    tokens per second; sending a message consumes a single token.  A
+    ``rate`` of zero disables throttling altogether.
+    """
+    def __init__(self, rate, burst, clock=time.time):
+        self.clock = clock
+        self.rate = self.validate_rate(rate)
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = self.clock()
+
+    def refill(self):
+        now = self.clock()
+        elapsed = max(now - self.updated, 0)
+        self.updated = now
+        if self.rate:
+            self.tokens = min(
+                float(self.burst),
+                self.tokens + elapsed * self.rate
+            )
+
+    @staticmethod
+    def validate_rate(rate):
+        # A negative rate would drain the bucket rather than refill it,
+        # and we'd never be able to send another message.
+        if not rate >= 0:
+            raise ValueError('Rate must not be negative: %r' % rate)
+        return rate
+
+    def set_rate(self, rate):
+        # Tokens accumulated under the old rate are kept; only the
+        # speed at which they're replenished changes.
+        self.validate_rate(rate)
+        self.refill()
+        self.rate = rate
+
+    def set_burst(self, burst):
+        self.refill()
+        self.burst = max(burst, 1)
+        self.tokens = min(self.tokens, float(self.burst))
+
+    def consume(self, tokens=1):
+        if not self.rate:
+            return True
+        self.refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    def get_wait_seconds(self, tokens=1):
+        if not self.rate:
+            return 0
+        self.refill()
+        missing = tokens - self.tokens
+        if missing <= 0:
+            return 0
+        return missing / self.rate
+
+
+class Backoff(object):
+    """Delays between attempts at something that keeps failing.
+
+    The first delay is ``initial`` seconds, and each one after that is
+    ``factor`` times longer, up to ``maximum`` seconds.  Each delay is
+    shortened by up to ``jitter`` of itself at random, so that clients
+    that failed at the same time don't all retry at the same time, too.
+    """
+    def __init__(
+        self, initial=1, maximum=60, factor=2, jitter=0.25,
+        random=random.random
+    ):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self.random = random
+        self.attempts = 0
+
+    def get_delay(self):
+        delay = min(
+            self.initial * self.factor ** self.attempts, self.maximum
+        )
+        self.attempts += 1
+        return delay * (1 - self.jitter * self.random())
+
+    def reset(self):
+        self.attempts = 0
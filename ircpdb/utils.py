@@ -1,4 +1,11 @@
-from six import text_type
+import logging
+import os
+import tempfile
+
+from six import binary_type, text_type
+
+
+logger = logging.getLogger(__name__)
 
 
 def comma_separated_list(string):
@@ -7,3 +14,70 @@ def comma_separated_list(string):
     return [
         text_type(v) for v in string.split(',')
     ]
+
+
+def boolean(string):
+    if isinstance(string, bool):
+        return string
+    return text_type(string).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def get_byte_length(string):
+    if isinstance(string, binary_type):
+        return len(string)
+    return len(string.encode('utf-8'))
+
+
+def split_utf8(string, max_bytes):
+    """Split `string` into pieces no longer than `max_bytes` when encoded.
+
+    Pieces are always split on character boundaries, so multi-byte
+    characters are never broken across two pieces.
+    """
+    if isinstance(string, binary_type):
+        string = string.decode('utf-8', 'replace')
+    encoded = string.encode('utf-8')
+    pieces = []
+    start = 0
+    while start < len(encoded):
+        end = min(start + max_bytes, len(encoded))
+        # Back up until `end` no longer points at a UTF-8
+        # continuation byte (0b10xxxxxx).
+        while end < len(encoded) and end > start and (
+            ord(encoded[end:end + 1]) & 0xC0 == 0x80
+        ):
+            end -= 1
+        if end == start:
+            # `max_bytes` is smaller than a single character; there's
+            # nothing sensible left to do but emit the character anyway.
+            end = start + 1
+            while end < len(encoded) and (
+                ord(encoded[end:end + 1]) & 0xC0 == 0x80
+            ):
+                end += 1
+        pieces.append(encoded[start:end].decode('utf-8'))
+        start = end
+    return pieces
+
+
+def write_atomically(path, content):
+    """Replace the file at `path` with `content` all at once.
+
+    Readers (including other processes) see either the old file or the
+    new one, never a partly-written one.  Returns whether the file was
+    written; failures are logged rather than raised.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    temp_path = None
+    try:
+        fd, temp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'w') as out:
+            out.write(content)
+        os.rename(temp_path, path)
+        return True
+    except (IOError, OSError) as e:
+        logger.warning('Unable to write %s: %s', path, e)
+        return False
+    finally:
+        if temp_path is not None and os.path.exists(temp_path):
+            os.unlink(temp_path)
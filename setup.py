@@ -57,6 +57,11 @@ setup(
     install_requires=requirements,
     tests_require=['tox', 'pytest', 'mock'],
     cmdclass = {'test': Tox},
+    entry_points={
+        'console_scripts': [
+            'ircpdb-hub = ircpdb.hub:main',
+        ],
+    },
     classifiers=[
         "Development Status :: 4 - Beta",
         "Intended Audience :: Developers",
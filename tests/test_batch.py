@@ -0,0 +1,57 @@
+from unittest import TestCase
+
+from ircpdb.batch import Batch, split_commands
+
+
+class TestSplitCommands(TestCase):
+    def test_splits_outside_quotes(self):
+        self.assertEqual(
+            ['n', 'p "a;b"', "p 'c;d'", 'p e'],
+            split_commands('n; p "a;b"; p \'c;d\' ;p e;'),
+        )
+
+    def test_escaped_separators(self):
+        self.assertEqual(
+            ['for i in x: a(i); b(i)', 'n'],
+            split_commands('for i in x: a(i)\\; b(i); n'),
+        )
+        self.assertEqual(['p "a\\;b"'], split_commands('p "a\\;b"'))
+
+    def test_escaped_quotes(self):
+        self.assertEqual(
+            ['p "a\\";b"', 'n'], split_commands('p "a\\";b"; n')
+        )
+
+
+class TestBatch(TestCase):
+    def test_collects_output_under_headers(self):
+        batch = Batch(['n', 'p x'])
+
+        self.assertEqual('n', batch.get_next_command())
+        batch.add_output('> file(2)\n', False)
+        batch.add_output('-> x = 1\n', True)
+        self.assertEqual('p x', batch.get_next_command())
+        batch.add_output('1\n', True)
+        self.assertIsNone(batch.get_next_command())
+
+        self.assertEqual(
+            ['(Pdb) n', '> file(2)', '-> x = 1', '(Pdb) p x', '1'],
+            batch.get_lines(),
+        )
+
+    def test_aborts_on_error(self):
+        batch = Batch(['p y', 'n', 'n'])
+
+        batch.get_next_command()
+        batch.add_output("*** NameError: name 'y' is not defined", True)
+
+        self.assertIsNone(batch.get_next_command())
+        self.assertIn('skipped 2', batch.get_lines()[-1])
+
+    def test_continues_on_error_if_asked(self):
+        batch = Batch(['p y', 'n'], abort_on_error=False)
+
+        batch.get_next_command()
+        batch.add_output("*** NameError: name 'y' is not defined", True)
+
+        self.assertEqual('n', batch.get_next_command())
@@ -1,8 +1,11 @@
+from collections import deque
+import os
 from unittest import TestCase
 
 from mock import DEFAULT, MagicMock, patch
 
 from ircpdb.bot import IrcpdbBot
+from ircpdb.pager import OutputPager
 
 
 class TestBot(TestCase):
@@ -52,3 +55,453 @@ class TestBot(TestCase):
                 self.fail(
                     'Message was sent to the channel.'
                 )
+
+    def test_send_lines_does_not_block_when_throttled(self):
+        self.bot.bucket.burst = 2
+        self.bot.bucket.tokens = 2
+
+        with patch.multiple(
+            self.bot, connection=DEFAULT, reactor=DEFAULT
+        ) as mocked:
+            self.bot.send_lines(self.arbitrary_channel, ['a', 'b', 'c', 'd'])
+
+            self.assertEqual(2, mocked['connection'].send_raw.call_count)
+            self.assertEqual(2, len(self.bot.outbox))
+            self.assertEqual(1, mocked['reactor'].execute_delayed.call_count)
+
+    def test_mirrored_output_uses_multi_target_privmsg(self):
+        self.bot.mirror_channels = ['#ops', '#team']
+
+        with patch.multiple(
+            self.bot, connection=DEFAULT, reactor=DEFAULT
+        ) as mocked:
+            mocked['connection'].features.targmax = {'PRIVMSG': 2}
+            self.bot.send_lines(self.bot.get_channel_target(), ['a', 'b'])
+
+            self.assertEqual(
+                [
+                    'PRIVMSG #debugger_hangout,#ops :a',
+                    'PRIVMSG #team :a',
+                    'PRIVMSG #debugger_hangout,#ops :b',
+                    'PRIVMSG #team :b',
+                ],
+                [
+                    call[0][0]
+                    for call in mocked['connection'].send_raw.call_args_list
+                ]
+            )
+
+    def test_mirrored_output_falls_back_to_one_target_per_message(self):
+        self.bot.mirror_channels = ['#ops']
+
+        self.assertEqual(
+            ['#debugger_hangout', '#ops'],
+            self.bot.get_target_groups(self.bot.get_channel_target())
+        )
+
+    def test_negotiates_multiline_capabilities(self):
+        connection = MagicMock()
+
+        self.bot.on_cap(connection, MagicMock(arguments=[
+            'LS', '*', 'sasl batch message-tags',
+        ]))
+        self.assertFalse(connection.cap.called)
+        self.bot.on_cap(connection, MagicMock(arguments=[
+            'LS', 'draft/multiline=max-bytes=4096,max-lines=24',
+        ]))
+        connection.cap.assert_called_with(
+            'REQ', 'batch', 'message-tags', 'draft/multiline'
+        )
+        self.bot.on_cap(connection, MagicMock(arguments=[
+            'ACK', 'batch message-tags draft/multiline',
+        ]))
+        connection.cap.assert_called_with('END')
+        self.assertEqual((4096, 24), self.bot.multiline_limits)
+
+    def test_negotiation_ends_without_multiline_support(self):
+        connection = MagicMock()
+
+        self.bot.on_cap(connection, MagicMock(arguments=['LS', 'sasl']))
+
+        connection.cap.assert_called_once_with('END')
+        self.assertIsNone(self.bot.multiline_limits)
+
+    def test_lines_are_sent_as_multiline_batches(self):
+        self.bot.multiline_limits = (7, None)
+
+        with patch.multiple(
+            self.bot, connection=DEFAULT, reactor=DEFAULT
+        ) as mocked:
+            self.bot.send_lines(self.arbitrary_channel, ['aaa', 'bbb', 'c'])
+
+            self.assertEqual(
+                [
+                    'BATCH +p1 draft/multiline #debugger_hangout',
+                    '@batch=p1 PRIVMSG #debugger_hangout :aaa',
+                    '@batch=p1 PRIVMSG #debugger_hangout :bbb',
+                    'BATCH -p1',
+                    'PRIVMSG #debugger_hangout :c',
+                ],
+                [
+                    call[0][0]
+                    for call in mocked['connection'].send_raw.call_args_list
+                ]
+            )
+        self.assertEqual(
+            2, self.bot.metrics.metrics['irc_messages_sent'].value
+        )
+
+    def test_access_can_be_limited_to_a_channel(self):
+        self.bot.limit_access_to = ['alice', '#ops:bob']
+
+        self.assertTrue(self.bot.is_allowed('alice', '#team'))
+        self.assertTrue(self.bot.is_allowed('bob', '#OPS'))
+        self.assertFalse(self.bot.is_allowed('bob', '#team'))
+        self.assertFalse(self.bot.is_allowed('bob'))
+
+    def test_set_message_wait_seconds_changes_refill_rate(self):
+        self.bot.message_wait_seconds = 0.25
+
+        self.assertEqual(4, self.bot.bucket.rate)
+
+    def test_invalid_message_wait_seconds_are_refused(self):
+        event = MagicMock()
+        event.source.nick = 'alice'
+        self.bot.limit_access_to = ['alice']
+
+        with patch.object(self.bot, 'send_channel_message') as send:
+            for value in ['-1', 'inf', 'nan']:
+                self.bot.do_command(
+                    event, '!set_message_wait_seconds %s' % value
+                )
+                self.assertIn('must be 0', send.call_args[0][0])
+
+        self.assertEqual(
+            self.arbitrary_message_wait_seconds,
+            self.bot.message_wait_seconds
+        )
+        self.assertEqual(1 / 0.8, self.bot.bucket.rate)
+
+    def test_message_budget_accounts_for_prefix_and_target(self):
+        self.bot.hostmask = 'testAccount!~test@example.com'
+
+        budget = self.bot.get_message_budget(self.arbitrary_channel)
+
+        overhead = len(
+            ':testAccount!~test@example.com PRIVMSG #debugger_hangout :\r\n'
+        )
+        self.assertEqual(512 - overhead, budget)
+
+    def test_chunked_lines_split_on_utf8_boundaries(self):
+        line = u'é' * 10  # Two bytes per character
+
+        chunked = self.bot.get_chunked_lines([line], chunk_size=5)
+
+        self.assertEqual(u''.join(chunked), line)
+        for chunk in chunked:
+            self.assertTrue(len(chunk.encode('utf-8')) <= 5)
+
+    def test_packed_lines_fill_budget(self):
+        delimiter = self.bot.PACK_DELIMITER
+        lines = ['a' * 10, 'b' * 10, '', 'c' * 10]
+        budget = 20 + len(delimiter.encode('utf-8'))
+
+        packed = self.bot.get_packed_lines(lines, budget)
+
+        self.assertEqual(
+            [
+                delimiter.join(['a' * 10, 'b' * 10]),
+                'c' * 10,
+            ],
+            packed
+        )
+
+    def test_process_forever_relays_pdb_output_until_pipe_closes(self):
+        r_pipe, w_pipe = os.pipe()
+        inhandle = os.fdopen(r_pipe, 'r')
+        os.write(w_pipe, b'-> x = 1\n(Pdb) ')
+        os.close(w_pipe)
+        outhandle = MagicMock()
+
+        with patch.multiple(
+            self.bot,
+            _connect=DEFAULT,
+            send_channel_message=DEFAULT,
+            send_prompt=DEFAULT,
+        ) as mocked:
+            self.bot.process_forever(inhandle, outhandle)
+
+            mocked['send_channel_message'].assert_called_once_with(
+                '-> x = 1'
+            )
+            self.assertEqual(1, mocked['send_prompt'].call_count)
+        inhandle.close()
+
+    def test_long_response_is_pasted_in_the_background(self):
+        self.bot.joined = True
+        self.bot.paste_minimum_response_length = 2
+        self.bot.paste_backend = MagicMock()
+        self.bot.paste_backend.paste.return_value = 'http://paste/1'
+
+        with patch.multiple(
+            self.bot, send_lines=DEFAULT, reactor=DEFAULT
+        ) as mocked:
+            self.bot.send_channel_message('one\ntwo\nthree')
+            mocked['send_lines'].assert_called_once_with(
+                self.arbitrary_channel, 'Pasting 3 lines...'
+            )
+
+            self.bot.paste_executor.shutdown(wait=True)
+            for callback in self.bot.callbacks.drain():
+                callback()
+
+            mocked['send_lines'].assert_called_with(
+                self.arbitrary_channel,
+                'See http://paste/1 (3 lines in result)',
+            )
+
+    def test_paste_timeout_falls_back_to_irc(self):
+        future = MagicMock()
+        self.bot.pending_pastes.add(future)
+
+        with patch.object(self.bot, 'send_lines') as send_lines:
+            self.bot.on_paste_timeout(
+                future, self.arbitrary_channel, ['one', 'two']
+            )
+            send_lines.assert_called_with(
+                self.arbitrary_channel, ['one', 'two']
+            )
+
+            # A late result should be ignored entirely
+            send_lines.reset_mock()
+            self.bot.on_paste_complete(
+                future, self.arbitrary_channel, ['one', 'two']
+            )
+            self.assertFalse(send_lines.called)
+
+    def test_cached_paste_is_reused_without_uploading(self):
+        self.bot.joined = True
+        self.bot.paste_backend = MagicMock()
+        lines = ['one', 'two']
+        self.bot.paste_cache.set(
+            self.bot.paste_cache.get_key(lines), 'http://paste/1'
+        )
+
+        with patch.object(self.bot, 'send_lines') as send_lines:
+            self.bot.send_channel_message(lines, paste=True)
+
+            send_lines.assert_called_once_with(
+                self.arbitrary_channel,
+                'See http://paste/1 (2 lines in result)',
+            )
+        self.assertFalse(self.bot.paste_backend.paste.called)
+
+    def test_stopping_while_connecting_is_not_forgotten(self):
+        with patch.multiple(
+            self.bot, _connect=DEFAULT, disconnect=DEFAULT,
+            schedule_reconnect=DEFAULT,
+        ) as mocked:
+            mocked['_connect'].side_effect = self.bot.stop
+
+            self.bot.run()
+
+            mocked['disconnect'].assert_called_once_with()
+            self.assertFalse(mocked['schedule_reconnect'].called)
+        self.assertFalse(self.bot.running)
+
+    def test_greeting_waits_until_pdb_is_attached(self):
+        r_pipe, w_pipe = os.pipe()
+        inhandle = os.fdopen(r_pipe, 'r')
+
+        with patch.object(self.bot, 'greet') as greet:
+            self.bot.on_welcome(MagicMock(), MagicMock())
+            self.assertFalse(greet.called)
+
+            self.bot.attach(inhandle, MagicMock())
+            greet.assert_called_once_with()
+        self.assertIn(inhandle, self.bot.readers)
+        inhandle.close()
+        os.close(w_pipe)
+
+    def test_output_is_buffered_and_replayed_after_reconnecting(self):
+        self.bot.attached = True
+        self.bot.greeted = True
+        self.bot.pre_join_queue = deque(maxlen=2)
+        reactor = MagicMock()
+
+        with patch.multiple(
+            self.bot, reactor=reactor, send_lines=DEFAULT
+        ) as mocked:
+            self.bot._on_disconnect(MagicMock(), MagicMock())
+            for message in ['one', 'two', 'three']:
+                self.bot.send_channel_message(message)
+            self.assertFalse(mocked['send_lines'].called)
+
+            self.bot.on_welcome(MagicMock(), MagicMock())
+
+        sent = [
+            call[0][1] for call in mocked['send_lines'].call_args_list
+        ]
+        self.assertIn('Reconnected after', sent[0][0])
+        self.assertEqual(
+            [
+                ['(1 earlier messages were dropped)'],
+                ['two'],
+                ['three'],
+                self.bot.PROMPT,
+            ],
+            sent[1:]
+        )
+
+    def test_debugger_continues_if_reconnecting_takes_too_long(self):
+        self.bot.attached = True
+        reactor = MagicMock()
+
+        with patch.multiple(
+            self.bot, reactor=reactor, continue_debugger=DEFAULT
+        ) as mocked:
+            self.bot._on_disconnect(MagicMock(), MagicMock())
+            delay, on_deadline = reactor.execute_delayed.call_args_list[0][0]
+            self.assertEqual(self.bot.reconnect_deadline, delay)
+
+            on_deadline()
+            mocked['continue_debugger'].assert_called_once_with()
+
+    def test_reconnecting_continues_if_dropped_before_welcome(self):
+        self.bot.attached = True
+        reactor = MagicMock()
+        connection = MagicMock()
+        connection.is_connected.return_value = False
+
+        def connect():
+            connection.is_connected.return_value = True
+
+        with patch.multiple(
+            self.bot, reactor=reactor, connection=connection,
+            _connect=DEFAULT,
+        ) as mocked:
+            mocked['_connect'].side_effect = connect
+            self.bot._on_disconnect(MagicMock(), MagicMock())
+            # The deadline, then the first attempt.
+            self.assertEqual(2, reactor.execute_delayed.call_count)
+            reactor.execute_delayed.call_args_list[1][0][1]()
+            mocked['_connect'].assert_called_once_with()
+            self.assertEqual(2, reactor.execute_delayed.call_count)
+
+            # Accepted, then dropped before the server welcomed us.
+            connection.is_connected.return_value = False
+            self.bot._on_disconnect(MagicMock(), MagicMock())
+            self.assertEqual(3, reactor.execute_delayed.call_count)
+            reactor.execute_delayed.call_args_list[2][0][1]()
+            self.assertEqual(2, mocked['_connect'].call_count)
+
+    def test_close_waits_for_remaining_output(self):
+        self.bot.outbox.append((['PRIVMSG #debugger_hangout :a'], 0))
+        self.bot.pending_pastes.add(MagicMock())
+
+        with patch.multiple(
+            self.bot, disconnect=DEFAULT, stop=DEFAULT
+        ) as mocked:
+            self.bot.close()
+            self.bot.outbox.clear()
+            self.bot.finish_closing()
+            self.assertFalse(mocked['disconnect'].called)
+
+            self.bot.pending_pastes.clear()
+            self.bot.finish_closing()
+            mocked['disconnect'].assert_called_once_with()
+        self.assertTrue(self.bot.closed.is_set())
+
+    def test_pager_holds_back_long_output(self):
+        self.bot.joined = True
+        self.bot.limit_access_to = ['alice']
+        self.bot.pager = OutputPager(page_lines=2)
+        event = MagicMock()
+        event.source.nick = 'alice'
+        output = '\n'.join('line %s' % i for i in range(5))
+
+        with patch.multiple(
+            self.bot, send_channel_message=DEFAULT, queue=DEFAULT
+        ) as mocked:
+            self.bot.send_debugger_output(output, True)
+            mocked['send_channel_message'].assert_any_call(
+                ['line 0', 'line 1']
+            )
+
+            self.bot.do_command(event, 'more')
+            mocked['send_channel_message'].assert_any_call(
+                ['line 2', 'line 3']
+            )
+            self.bot.do_command(event, 'more')
+            self.assertFalse(mocked['queue'].put.called)
+
+            # Once the pager is empty, `more` is pdb's.
+            self.bot.do_command(event, 'more')
+            mocked['queue'].put.assert_called_once_with('more')
+
+    def test_diff_mode_abbreviates_repeated_responses(self):
+        self.bot.diff_mode = True
+        self.bot.outhandle = MagicMock()
+        before = '\n'.join('x%s = %s' % (i, i) for i in range(10))
+        after = before.replace('x5 = 5', 'x5 = 50')
+
+        responses = []
+        for command, response in (
+            ('n', 'first'),
+            ('p locals()', before),
+            ('p locals()', before),
+            ('p locals()', after),
+        ):
+            self.bot.send_command(command)
+            responses.append(
+                self.bot.get_diffed_response(
+                    self.bot.pending_commands.popleft()[0], response, True
+                )
+            )
+
+        self.assertEqual('first', responses[0])
+        self.assertEqual(before, responses[1])
+        self.assertIn('unchanged', responses[2])
+        self.assertIn('-x5 = 5', responses[3].split('\n'))
+        self.assertIn('+x5 = 50', responses[3].split('\n'))
+        self.assertNotIn('x0 = 0', responses[3])
+        self.assertEqual(after, self.bot.last_full_response)
+
+    def test_escaped_separator_is_sent_to_pdb_unescaped(self):
+        self.bot.limit_access_to = ['alice']
+        event = MagicMock()
+        event.source.nick = 'alice'
+
+        self.bot.do_command(event, 'a(1)\\; b(2)')
+
+        self.assertEqual(['a(1); b(2)'], self.bot.queue.drain())
+        self.assertIsNone(self.bot.batch)
+
+    def test_batch_is_fed_to_pdb_without_prompting(self):
+        self.bot.joined = True
+        self.bot.limit_access_to = ['alice']
+        self.bot.outhandle = MagicMock()
+        event = MagicMock()
+        event.source.nick = 'alice'
+        reader = MagicMock(eof=False, last_read=0)
+
+        with patch.multiple(
+            self.bot,
+            send_channel_message=DEFAULT,
+            send_prompt=DEFAULT,
+        ) as mocked:
+            self.bot.do_command(event, 'n; p x')
+            self.assertEqual(['n'], self.bot.queue.drain())
+            self.bot.send_command('n')
+
+            reader.read.return_value = [('-> x = 1\n', True)]
+            self.bot.on_pdb_output(reader)
+            self.bot.outhandle.write.assert_called_with(u'p x\n')
+            self.assertFalse(mocked['send_prompt'].called)
+
+            reader.read.return_value = [('1\n', True)]
+            self.bot.on_pdb_output(reader)
+            mocked['send_channel_message'].assert_called_once_with(
+                '(Pdb) n\n-> x = 1\n(Pdb) p x\n1'
+            )
+            self.assertEqual(1, mocked['send_prompt'].call_count)
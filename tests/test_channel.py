@@ -0,0 +1,37 @@
+import select
+from unittest import TestCase
+
+from six.moves.queue import Empty
+
+from ircpdb.channel import CommandChannel
+
+
+class TestCommandChannel(TestCase):
+    def setUp(self):
+        self.channel = CommandChannel()
+
+    def tearDown(self):
+        self.channel.close()
+
+    def is_readable(self):
+        readable, _, _ = select.select([self.channel], [], [], 0)
+        return bool(readable)
+
+    def test_put_makes_channel_readable(self):
+        self.assertFalse(self.is_readable())
+
+        self.channel.put('n')
+
+        self.assertTrue(self.is_readable())
+
+    def test_drain_returns_items_in_order_and_clears_wakeups(self):
+        self.channel.put('n')
+        self.channel.put('s')
+
+        self.assertEqual(['n', 's'], self.channel.drain())
+        self.assertTrue(self.channel.empty())
+        self.assertFalse(self.is_readable())
+
+    def test_get_raises_empty(self):
+        with self.assertRaises(Empty):
+            self.channel.get()
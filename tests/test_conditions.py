@@ -0,0 +1,74 @@
+import sys
+from unittest import TestCase
+
+from mock import patch
+
+from ircpdb import conditions
+from ircpdb.debugger import set_trace
+
+from .utils import FakeClock
+
+
+class TestConditions(TestCase):
+    def setUp(self):
+        conditions.reset()
+        self.clock = FakeClock()
+        self.frame = sys._getframe()
+
+    def should_break(self, **kwargs):
+        return conditions.should_break(
+            self.frame, clock=self.clock, **kwargs
+        )
+
+    def test_when(self):
+        self.assertFalse(self.should_break(when=False))
+        self.assertTrue(self.should_break(when=True))
+        self.assertFalse(self.should_break(when=lambda: 0))
+        self.assertTrue(self.should_break(when=lambda: 1))
+
+    def test_sample_rate(self):
+        self.assertFalse(
+            self.should_break(sample_rate=0.25, random=lambda: 0.5)
+        )
+        self.assertTrue(
+            self.should_break(sample_rate=0.25, random=lambda: 0.1)
+        )
+
+    def test_unsampled_calls_skip_when(self):
+        calls = []
+
+        self.assertFalse(self.should_break(
+            when=lambda: calls.append(1), sample_rate=0.25,
+            random=lambda: 0.5,
+        ))
+        self.assertEqual([], calls)
+
+    def test_max_hits(self):
+        self.assertTrue(self.should_break(max_hits=2))
+        self.assertTrue(self.should_break(max_hits=2))
+        self.assertFalse(self.should_break(max_hits=2))
+
+    def test_non_matching_calls_do_not_count_as_hits(self):
+        self.assertFalse(self.should_break(max_hits=1, when=False))
+        self.assertTrue(self.should_break(max_hits=1, when=True))
+
+    def test_cooldown(self):
+        self.assertTrue(self.should_break(cooldown=10))
+        self.clock.now += 5
+        self.assertFalse(self.should_break(cooldown=10))
+        self.clock.now += 5
+        self.assertTrue(self.should_break(cooldown=10))
+
+    def test_call_sites_are_tracked_separately(self):
+        self.assertTrue(self.should_break(max_hits=1))
+        self.assertTrue(
+            conditions.should_break(sys._getframe(), max_hits=1)
+        )
+
+    @patch('ircpdb.debugger.Ircpdb')
+    def test_set_trace_returns_before_creating_debugger(self, ircpdb):
+        set_trace(channel='#chan', when=False)
+        self.assertFalse(ircpdb.called)
+
+        set_trace(channel='#chan', when=True)
+        ircpdb.assert_called_once_with(channel='#chan')
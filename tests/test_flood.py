@@ -0,0 +1,112 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mock import MagicMock
+
+from ircpdb.bot import IrcpdbBot
+from ircpdb.flood import AdaptiveRate, FloodProfiles, LagMonitor
+
+
+class TestAdaptiveRate(TestCase):
+    def test_rate_increases_additively_while_throttled(self):
+        rate = AdaptiveRate(1, 4, increase=0.5, window=2)
+
+        self.assertFalse(rate.on_throttled_send())
+        self.assertTrue(rate.on_throttled_send())
+        self.assertEqual(1.5, rate.rate)
+
+    def test_penalty_decreases_rate_and_burst_multiplicatively(self):
+        rate = AdaptiveRate(2, 5, min_rate=0.2)
+
+        rate.on_penalty()
+        self.assertEqual((1, 2), (rate.rate, rate.burst))
+        for _ in range(10):
+            rate.on_penalty()
+        self.assertEqual((0.2, 1), (rate.rate, rate.burst))
+
+    def test_burst_recovers_additively_after_penalty(self):
+        rate = AdaptiveRate(1, 4, window=1)
+        rate.on_penalty()
+        self.assertEqual(2, rate.burst)
+
+        self.assertTrue(rate.on_throttled_send())
+        self.assertEqual(3, rate.burst)
+        for _ in range(5):
+            rate.on_throttled_send()
+        self.assertEqual(4, rate.burst)
+
+    def test_rate_is_capped(self):
+        rate = AdaptiveRate(10, 5, max_rate=10, window=1)
+
+        self.assertFalse(rate.on_throttled_send())
+        self.assertEqual(10, rate.rate)
+
+
+class TestLagMonitor(TestCase):
+    def test_lag_is_measured_against_fastest_round_trip(self):
+        now = [0]
+        monitor = LagMonitor(factor=3, slack=1, clock=lambda: now[0])
+
+        monitor.start('a')
+        now[0] += 0.5
+        self.assertFalse(monitor.finish('a'))
+        monitor.start('b')
+        now[0] += 2
+        self.assertFalse(monitor.finish('b'))
+        monitor.start('c')
+        now[0] += 3
+        self.assertTrue(monitor.finish('c'))
+        self.assertEqual(3, monitor.last)
+        self.assertFalse(monitor.finish('unknown'))
+
+
+class TestFloodProfiles(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'flood.json')
+
+    def test_profiles_are_persisted_per_server(self):
+        FloodProfiles(self.path).set('irc.example.com:6667', 0.5, 2)
+
+        profiles = FloodProfiles(self.path)
+        self.assertEqual(
+            (0.5, 2),
+            (
+                profiles.get('irc.example.com:6667')['rate'],
+                profiles.get('irc.example.com:6667')['burst'],
+            )
+        )
+        self.assertIsNone(profiles.get('irc.example.com:6697'))
+
+    def get_bot(self):
+        return IrcpdbBot(
+            '#chan', 'bot', 'irc.example.com', 6667, None, ['alice'],
+            0.5, 1000, 60, message_burst=4, adaptive_flood_control=True,
+            flood_profile_path=self.path,
+        )
+
+    def test_excess_flood_slows_bot_down(self):
+        bot = self.get_bot()
+        self.assertEqual((2, 4), (bot.bucket.rate, bot.bucket.burst))
+        event = MagicMock(
+            target='Closing Link: bot (Excess Flood)', arguments=[]
+        )
+
+        bot.on_error(MagicMock(), event)
+
+        self.assertEqual((1, 2), (bot.bucket.rate, bot.bucket.burst))
+        self.assertEqual(1, bot.metrics.metrics['flood_penalties'].value)
+        # The next session starts where this one left off.
+        bot = self.get_bot()
+        self.assertEqual((1, 2), (bot.bucket.rate, bot.bucket.burst))
+
+    def test_unrelated_errors_are_ignored(self):
+        bot = self.get_bot()
+        event = MagicMock(target='Closing Link: bot (Quit)', arguments=[])
+
+        bot.on_error(MagicMock(), event)
+
+        self.assertEqual((2, 4), (bot.bucket.rate, bot.bucket.burst))
@@ -0,0 +1,147 @@
+import json
+import os
+import shutil
+import socket
+import tempfile
+from unittest import TestCase
+
+from mock import DEFAULT, MagicMock, patch
+
+from ircpdb.debugger import connect_to_hub
+from ircpdb.exceptions import IrcpdbError
+from ircpdb.hub import get_private_directory, HubBot, HubSession
+
+
+class TestHub(TestCase):
+    def setUp(self):
+        self.arbitrary_channel = '#debugger_hangout'
+        self.arbitrary_allowed_nickname = 'alpha'
+        self.bot = HubBot(
+            channel=self.arbitrary_channel,
+            nickname='hub',
+            server='irc.mycompany.org',
+            port=6667,
+            password=None,
+            limit_access_to=[self.arbitrary_allowed_nickname],
+            message_wait_seconds=0,
+            paste_minimum_response_length=1000,
+            activation_timeout=60,
+        )
+
+    def attach(self):
+        local, remote = socket.socketpair()
+        self.addCleanup(local.close)
+        self.addCleanup(remote.close)
+        session = HubSession(self.bot.next_session_number, remote)
+        self.bot.next_session_number += 1
+        self.bot.sessions[session.number] = session
+        local.sendall(
+            json.dumps({'host': 'web1', 'pid': 100}).encode('utf-8') + b'\n'
+        )
+        return local, session
+
+    def test_session_output_is_prefixed_with_session_number(self):
+        local, session = self.attach()
+        local.sendall(b'-> x = 1\n(Pdb) ')
+
+        with patch.multiple(
+            self.bot,
+            send_channel_message=DEFAULT,
+            send_session_prompt=DEFAULT,
+        ) as mocked:
+            self.bot.on_session_output(session)
+
+            mocked['send_channel_message'].assert_called_with(
+                u'[1] -> x = 1'
+            )
+            mocked['send_session_prompt'].assert_called_with(session)
+        self.assertEqual('web1', session.info['host'])
+
+    def test_commands_are_routed_by_session_number(self):
+        first, _ = self.attach()
+        second, _ = self.attach()
+
+        self.bot.send_command('2 bt')
+
+        second.settimeout(1)
+        self.assertEqual(b'bt\n', second.recv(1024))
+
+    def test_ambiguous_commands_are_refused(self):
+        self.attach()
+        self.attach()
+
+        with patch.object(self.bot, 'send_channel_message') as send:
+            self.bot.send_command('bt')
+
+            self.assertTrue(send.called)
+
+    def test_macros_are_refused(self):
+        self.attach()
+        event = MagicMock()
+        event.source.nick = self.arbitrary_allowed_nickname
+        event.target = self.arbitrary_channel
+        self.bot.macros.get = MagicMock(return_value=['bt'])
+
+        with patch.object(self.bot, 'send_channel_message') as send:
+            self.bot.do_command(event, '!record start')
+            self.bot.do_command(event, '!play start')
+            self.bot.do_command(event, '1 bt')
+
+            self.assertIn("aren't available", send.call_args_list[0][0][0])
+            self.assertIn("aren't available", send.call_args_list[1][0][0])
+            self.assertEqual(2, send.call_count)
+        self.assertIsNone(self.bot.recording)
+        self.assertIsNone(self.bot.batch)
+
+    def test_sessions_end_when_debugger_detaches(self):
+        local, session = self.attach()
+        local.close()
+
+        with patch.object(self.bot, 'send_channel_message'):
+            # Once for the greeting, and once more for the EOF
+            self.bot.on_session_output(session)
+            self.bot.on_session_output(session)
+
+        self.assertNotIn(session.number, self.bot.sessions)
+        self.assertTrue(session.closed)
+
+
+class TestHubSocket(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'ircpdb.sock')
+
+    def listen(self):
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.addCleanup(listener.close)
+        listener.bind(self.path)
+        listener.listen(1)
+        return listener
+
+    def test_attaches_to_own_hub(self):
+        self.listen()
+
+        hub_socket = connect_to_hub(self.path)
+
+        self.assertIsNotNone(hub_socket)
+        hub_socket.close()
+
+    def test_refuses_hub_run_by_another_user(self):
+        self.listen()
+
+        with patch(
+            'ircpdb.debugger.get_socket_owner', return_value=os.getuid() + 1
+        ):
+            self.assertIsNone(connect_to_hub(self.path))
+
+    def test_socket_directory_must_be_private(self):
+        os.chmod(self.directory, 0o755)
+
+        with self.assertRaises(IrcpdbError):
+            get_private_directory(self.directory)
+
+        os.chmod(self.directory, 0o700)
+        self.assertEqual(
+            self.directory, get_private_directory(self.directory)
+        )
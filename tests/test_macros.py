@@ -0,0 +1,49 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mock import DEFAULT, MagicMock, patch
+
+from ircpdb.bot import IrcpdbBot
+from ircpdb.macros import MacroStore
+
+
+class TestMacroStore(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'macros.json')
+
+    def test_macros_are_persisted_per_channel(self):
+        MacroStore(self.path).set('#one', 'start', ['bt', 'up 3'])
+
+        store = MacroStore(self.path)
+        self.assertEqual(['bt', 'up 3'], store.get('#one', 'start'))
+        self.assertIsNone(store.get('#two', 'start'))
+        self.assertEqual(['start'], store.get_names('#one'))
+
+    def test_record_and_play(self):
+        bot = IrcpdbBot(
+            '#chan', 'bot', 'irc.example.com', 6667, None, ['alice'],
+            0, 1000, 60, macro_path=self.path,
+        )
+        event = MagicMock()
+        event.source.nick = 'alice'
+
+        with patch.multiple(
+            bot, send_channel_message=DEFAULT, start_batch=DEFAULT
+        ) as mocked:
+            bot.do_command(event, '!record start')
+            bot.do_command(event, 'bt')
+            bot.do_command(event, 'up 3; pp self.__dict__')
+            bot.do_command(event, '!stop')
+            bot.do_command(event, '!play start')
+
+            mocked['start_batch'].assert_called_with(
+                ['bt', 'up 3', 'pp self.__dict__']
+            )
+        self.assertEqual(
+            ['bt', 'up 3', 'pp self.__dict__'],
+            MacroStore(self.path).get('#chan', 'start'),
+        )
@@ -0,0 +1,56 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from ircpdb.metrics import Counter, Histogram, Metrics
+
+
+class TestMetrics(TestCase):
+    def setUp(self):
+        self.metrics = Metrics([
+            ('commands', Counter('Commands sent.')),
+            ('latency', Histogram('Latency.', (0.1, 1, 10))),
+        ])
+
+    def test_histogram(self):
+        for value in (0.05, 0.5, 0.5, 5, 50):
+            self.metrics.observe('latency', value)
+        histogram = self.metrics.metrics['latency']
+
+        self.assertEqual([1, 2, 1, 1], histogram.counts)
+        self.assertEqual(1, histogram.get_percentile(50))
+        self.assertEqual(50, histogram.get_percentile(100))
+
+    def test_summarize(self):
+        self.metrics.increment('commands', 3)
+
+        self.assertEqual(
+            ['commands: 3', 'latency: no observations'],
+            self.metrics.summarize(),
+        )
+
+    def test_prometheus(self):
+        self.metrics.increment('commands')
+        self.metrics.observe('latency', 0.5)
+
+        lines = self.metrics.as_prometheus().splitlines()
+        self.assertIn('# TYPE ircpdb_commands counter', lines)
+        self.assertIn('ircpdb_commands 1', lines)
+        self.assertIn('ircpdb_latency_bucket{le="0.1"} 0', lines)
+        self.assertIn('ircpdb_latency_bucket{le="1"} 1', lines)
+        self.assertIn('ircpdb_latency_bucket{le="+Inf"} 1', lines)
+        self.assertIn('ircpdb_latency_count 1', lines)
+
+    def test_dump_json(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'metrics.json')
+        self.metrics.increment('commands')
+
+        self.metrics.dump(path)
+
+        with open(path) as in_:
+            dumped = json.load(in_)
+        self.assertEqual({'type': 'counter', 'value': 1}, dumped['commands'])
@@ -0,0 +1,47 @@
+from unittest import TestCase
+
+from ircpdb.pager import OutputPager
+
+
+class TestOutputPager(TestCase):
+    def setUp(self):
+        self.pager = OutputPager(page_lines=3, buffer_lines=10)
+        self.lines = ['line %s' % i for i in range(8)]
+
+    def test_sends_first_page_only(self):
+        self.assertEqual(self.lines[:3], self.pager.add(self.lines))
+        self.assertEqual(5, self.pager.finish())
+        self.assertEqual(3, self.pager.get_page_count())
+
+    def test_first_page_spans_partial_output(self):
+        self.assertEqual(self.lines[:2], self.pager.add(self.lines[:2]))
+        self.assertEqual(self.lines[2:3], self.pager.add(self.lines[2:]))
+
+    def test_more(self):
+        self.pager.add(self.lines)
+        self.pager.finish()
+
+        self.assertEqual(self.lines[3:6], self.pager.get_more())
+        self.assertEqual(self.lines[6:], self.pager.get_more())
+        self.assertEqual(0, self.pager.get_remaining())
+
+    def test_page(self):
+        self.pager.add(self.lines)
+        self.pager.finish()
+
+        self.assertEqual(self.lines[6:], self.pager.get_page(3))
+        self.assertIsNone(self.pager.get_page(4))
+
+    def test_discards_oldest_output(self):
+        self.pager.add(self.lines)
+        self.pager.finish()
+        self.pager.add(['next %s' % i for i in range(8)])
+        self.pager.finish()
+
+        self.assertEqual(
+            ['line 6', 'line 7'], self.pager.grep(r'^line')
+        )
+        self.assertEqual(['next 3'], self.pager.grep('3'))
+        self.assertEqual(
+            ['next 3', 'next 4', 'next 5'], self.pager.get_page(2)
+        )
@@ -0,0 +1,137 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mock import MagicMock, patch
+import requests
+
+from ircpdb import paste_backends
+from ircpdb.exceptions import UnknownPasteBackend
+from ircpdb.paste_backends import GistBackend, LocalBackend
+
+
+class TestGistBackend(TestCase):
+    def setUp(self):
+        self.backend = GistBackend(timeout=5)
+
+    def test_session_is_created_lazily_and_reused(self):
+        with patch.object(self.backend, 'create_session') as create_session:
+            self.assertFalse(create_session.called)
+
+            first = self.backend.session
+            second = self.backend.session
+
+            self.assertEqual(1, create_session.call_count)
+            self.assertIs(first, second)
+
+    def test_close_closes_session(self):
+        session = MagicMock()
+        with patch.object(
+            self.backend, 'create_session', return_value=session
+        ):
+            self.backend.session
+            self.backend.close()
+
+            self.assertTrue(session.close.called)
+            self.assertIsNone(self.backend._session)
+
+    def test_paste_posts_through_session_with_timeout(self):
+        session = MagicMock()
+        session.post.return_value.json.return_value = {
+            'html_url': 'https://gist/1'
+        }
+        with patch.object(
+            self.backend, 'create_session', return_value=session
+        ):
+            url = self.backend.paste(['alpha', 'beta'])
+
+        self.assertEqual('https://gist/1', url)
+        _, kwargs = session.post.call_args
+        self.assertEqual(5, kwargs['timeout'])
+
+    def test_payload_is_streamed_in_chunks(self):
+        self.backend.CHUNK_SIZE = 10
+        lines = (u'line "%s" \u03b2' % i for i in range(10))
+
+        chunks = list(self.backend.iter_payload(lines))
+
+        self.assertTrue(len(chunks) > 1)
+        self.assertEqual(
+            {
+                'files': {
+                    'output.txt': {
+                        'content': u'\n'.join(
+                            u'line "%s" \u03b2' % i for i in range(10)
+                        )
+                    }
+                }
+            },
+            json.loads(b''.join(chunks).decode('utf-8')),
+        )
+
+
+class TestLocalBackend(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_paste_written_under_url(self):
+        backend = LocalBackend(
+            directory=self.directory,
+            url='http://pastes.internal/ircpdb',
+        )
+
+        url = backend.paste([u'alpha', u'\u03b2eta'])
+
+        self.assertTrue(url.startswith('http://pastes.internal/ircpdb/'))
+        path = os.path.join(self.directory, url.rsplit('/', 1)[1])
+        with open(path, 'rb') as in_:
+            self.assertEqual(
+                u'alpha\n\u03b2eta'.encode('utf-8'), in_.read()
+            )
+
+    def test_paste_served_in_process(self):
+        backend = LocalBackend(directory=self.directory)
+        self.addCleanup(backend.close)
+
+        url = backend.paste([u'alpha'])
+
+        port = backend.server.server_address[1]
+        response = requests.get(
+            'http://127.0.0.1:%s/%s' % (port, url.rsplit('/', 1)[1])
+        )
+        self.assertEqual(u'alpha', response.text)
+        self.assertFalse(backend.cacheable)
+
+
+class TestRegistry(TestCase):
+    def test_builtin_backends_selected_by_name(self):
+        backend = paste_backends.get_backend(
+            'local', {'paste_dir': '/srv/pastes', 'paste_timeout': 3}
+        )
+
+        self.assertIsInstance(backend, LocalBackend)
+        self.assertEqual('/srv/pastes', backend.directory)
+        self.assertEqual(3, backend.timeout)
+
+    def test_unknown_backend(self):
+        with patch.object(
+            paste_backends, 'iter_entry_points', return_value=[]
+        ):
+            with self.assertRaises(UnknownPasteBackend):
+                paste_backends.get_backend('nonexistent', {})
+
+    def test_backend_loaded_from_entry_point(self):
+        entry_point = MagicMock()
+        entry_point.name = 'custom'
+        entry_point.load.return_value = GistBackend
+        self.addCleanup(paste_backends.BACKENDS.pop, 'custom', None)
+
+        with patch.object(
+            paste_backends, 'iter_entry_points', return_value=[entry_point]
+        ):
+            backend = paste_backends.get_backend('custom', {})
+
+        self.assertIsInstance(backend, GistBackend)
@@ -0,0 +1,55 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from ircpdb.paste_cache import PasteCache
+
+from .utils import FakeClock
+
+
+class TestPasteCache(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = PasteCache(size=2, ttl=60, clock=self.clock)
+
+    def test_identical_lines_share_a_key(self):
+        self.assertEqual(
+            PasteCache.get_key(['a', 'b']),
+            PasteCache.get_key(['a', 'b']),
+        )
+        self.assertNotEqual(
+            PasteCache.get_key(['a', 'b']),
+            PasteCache.get_key(['a', 'c']),
+        )
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.set('a', 'http://paste/a')
+        self.cache.set('b', 'http://paste/b')
+        self.cache.get('a')
+
+        self.cache.set('c', 'http://paste/c')
+
+        self.assertEqual('http://paste/a', self.cache.get('a'))
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual('http://paste/c', self.cache.get('c'))
+
+    def test_entries_expire(self):
+        self.cache.set('a', 'http://paste/a')
+
+        self.clock.now += 61
+
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_entries_are_persisted(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'cache.json')
+
+        cache = PasteCache(path=path, clock=self.clock)
+        cache.set('a', 'http://paste/a')
+
+        self.assertEqual(
+            'http://paste/a',
+            PasteCache(path=path, clock=self.clock).get('a'),
+        )
@@ -0,0 +1,68 @@
+import os
+from unittest import TestCase
+
+from ircpdb.reader import FrameReader
+
+
+class TestFrameReader(TestCase):
+    def setUp(self):
+        self.r_pipe, self.w_pipe = os.pipe()
+        self.reader = FrameReader(self.r_pipe)
+
+    def tearDown(self):
+        os.close(self.r_pipe)
+        if self.w_pipe is not None:
+            os.close(self.w_pipe)
+
+    def write(self, data):
+        os.write(self.w_pipe, data)
+        return self.reader.read()
+
+    def test_frames_end_at_prompt(self):
+        frames = self.write(b'-> x = 1\n(Pdb) 2\n(Pdb) ')
+
+        self.assertEqual(
+            [(u'-> x = 1\n', True), (u' 2\n', True)],
+            frames,
+        )
+
+    def test_prompt_split_across_reads(self):
+        self.assertEqual([], self.write(b'-> x = 1\n(Pd'))
+
+        frames = self.write(b'b) ')
+
+        self.assertEqual([(u'-> x = 1\n', True)], frames)
+
+    def test_large_frames_are_flushed_before_prompt(self):
+        self.reader.flush_bytes = 10
+
+        frames = self.write(b'0123456789\nabc')
+
+        self.assertEqual([(u'0123456789\n', False)], frames)
+        self.assertEqual([(u'abc', True)], self.write(b'(Pdb) '))
+
+    def test_frames_are_truncated(self):
+        self.reader.max_frame_bytes = 4
+
+        frames = self.write(b'abcdefghij')
+        frames.extend(self.write(b'klmn(Pdb) '))
+
+        self.assertEqual(
+            [
+                (u'abcd', False),
+                (u'\n... (10 bytes of output truncated)', True),
+            ],
+            frames
+        )
+        # The next frame is unaffected
+        self.assertEqual([(u' ok', True)], self.write(b'ok(Pdb) '))
+
+    def test_eof(self):
+        self.write(b'partial')
+        os.close(self.w_pipe)
+        self.w_pipe = None
+
+        frames = self.reader.read()
+
+        self.assertTrue(self.reader.eof)
+        self.assertEqual([(u'partial', False)], frames)
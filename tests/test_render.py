@@ -0,0 +1,109 @@
+from collections import defaultdict, OrderedDict
+from unittest import TestCase
+
+from mock import MagicMock, patch
+from six import StringIO
+
+from ircpdb.debugger import Ircpdb
+from ircpdb.render import BoundedRenderer, Pager
+
+
+class TestBoundedRenderer(TestCase):
+    def render(self, obj, **kwargs):
+        return ''.join(BoundedRenderer(**kwargs).iter_tokens(obj))
+
+    def test_matches_repr_for_small_values(self):
+        value = {'a': [1, (2,), {'b': 'c'}], 'd': set(), 'e': None}
+        self.assertEqual(repr(value), self.render(value))
+
+    def test_limits_depth_and_items(self):
+        self.assertEqual(
+            '[[[...]], 1, 2, ... (7 more)]',
+            self.render(
+                [[[[]]]] + list(range(1, 10)), max_depth=2, max_items=3
+            ),
+        )
+
+    def test_renders_container_subclasses_item_by_item(self):
+        value = OrderedDict((i, i) for i in range(1000))
+
+        with patch('ircpdb.render.reprlib.Repr.repr_instance') as repr_:
+            rendered = self.render(value, max_items=2)
+
+        self.assertFalse(repr_.called)
+        self.assertEqual('OrderedDict({0: 0, 1: 1, ... (998 more)})', rendered)
+        counts = defaultdict(list)
+        counts['a'].append(1)
+        self.assertEqual("defaultdict({'a': [1]})", self.render(counts))
+
+    def test_limits_strings(self):
+        self.assertLess(len(self.render('x' * 10000, max_bytes=100)), 110)
+
+    def test_pretty_splits_long_containers_only(self):
+        value = {'short': [1, 2], 'long': ['x' * 40, 'y' * 40]}
+        self.assertEqual(
+            "{\n"
+            "  'short': [1, 2],\n"
+            "  'long': [\n"
+            "    '%s',\n"
+            "    '%s'\n"
+            "  ]\n"
+            "}" % ('x' * 40, 'y' * 40),
+            self.render(value, pretty=True),
+        )
+
+
+class TestPager(TestCase):
+    def test_renders_lazily(self):
+        consumed = []
+
+        def tokens():
+            for i in range(100):
+                consumed.append(i)
+                yield '%02d' % i
+
+        pager = Pager(tokens(), 10)
+
+        self.assertEqual('0001020304', pager.get_page())
+        self.assertEqual(6, len(consumed))
+        self.assertEqual('0506070809', pager.get_page())
+        self.assertFalse(pager.exhausted)
+
+
+class TestPrintCommands(TestCase):
+    @patch('ircpdb.debugger.create_bot')
+    @patch('os.fdopen', return_value=MagicMock())
+    @patch('os.pipe', return_value=(None, None))
+    def test_more_pages_through_value(self, pipe, fdopen, create_bot):
+        debugger = Ircpdb(channel='#chan', repr_max_bytes=20)
+        debugger.stdout = StringIO()
+        debugger._getval = lambda arg: list(range(100))
+
+        debugger.do_p('value')
+        debugger.do_more('')
+
+        lines = debugger.stdout.getvalue().splitlines()
+        self.assertEqual('[0, 1, 2, 3, 4, 5, 6', lines[0])
+        self.assertIn("'more'", lines[1])
+        self.assertEqual(', 7, 8, 9, 10, 11, ', lines[2])
+
+    @patch('ircpdb.debugger.create_bot')
+    @patch('os.fdopen', return_value=MagicMock())
+    @patch('os.pipe', return_value=(None, None))
+    def test_rendering_errors_are_displayed(self, pipe, fdopen, create_bot):
+        class Broken(list):
+            def __iter__(self):
+                return 1 / 0
+
+        debugger = Ircpdb(channel='#chan')
+        debugger.stdout = StringIO()
+        debugger._getval = lambda arg: Broken([1])
+
+        debugger.onecmd('p value')
+
+        self.assertTrue(
+            debugger.stdout.getvalue().startswith('*** ZeroDivisionError')
+        )
+        self.assertIsNone(debugger.pager)
+        debugger.do_more('')
+        self.assertIn('Nothing more', debugger.stdout.getvalue())
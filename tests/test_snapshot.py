@@ -0,0 +1,59 @@
+import sys
+from unittest import TestCase
+
+from mock import MagicMock, patch
+from six import StringIO
+
+from ircpdb.debugger import SnapshotDebugger
+from ircpdb.snapshot import Snapshot
+
+
+def outer(value):
+    return inner(value * 2)
+
+
+def inner(doubled):
+    items = list(range(1000))  # noqa
+    return Snapshot.capture(sys._getframe(), repr_limits={'maxlist': 3})
+
+
+class TestSnapshot(TestCase):
+    def setUp(self):
+        self.snapshot = outer(21)
+
+    def test_captures_bounded_reprs_of_each_frame(self):
+        inner_frame = self.snapshot.frames[-1]
+        outer_frame = self.snapshot.frames[-2]
+
+        self.assertEqual('inner', inner_frame.function)
+        self.assertEqual(['doubled'], inner_frame.arguments)
+        self.assertEqual('42', inner_frame.names['doubled'])
+        self.assertEqual('[0, 1, 2, ...]', inner_frame.names['items'])
+        self.assertIn('Snapshot.capture', inner_frame.get_current_line())
+        self.assertEqual('21', outer_frame.names['value'])
+        # Globals referred to by the frame's code are captured, too.
+        self.assertIn('inner', outer_frame.names)
+
+    def test_max_frames(self):
+        snapshot = Snapshot.capture(sys._getframe(), max_frames=1)
+        self.assertEqual(1, len(snapshot.frames))
+
+    @patch('ircpdb.debugger.create_bot')
+    @patch('os.fdopen', return_value=MagicMock())
+    @patch('os.pipe', return_value=(None, None))
+    def test_serves_read_only_commands(self, pipe, fdopen, create_bot):
+        debugger = SnapshotDebugger(self.snapshot, channel='#chan')
+        debugger.stdout = StringIO()
+
+        debugger.onecmd('p doubled')
+        debugger.onecmd('up')
+        debugger.onecmd('p value')
+        debugger.onecmd('next')
+
+        output = debugger.stdout.getvalue().splitlines()
+        self.assertEqual('42', output[0])
+        self.assertIn('outer()', output[1])
+        self.assertEqual('21', output[3])
+        self.assertEqual(
+            '*** "next" is not available for a snapshot.', output[4]
+        )
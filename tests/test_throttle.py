@@ -0,0 +1,60 @@
+from unittest import TestCase
+
+from ircpdb.throttle import Backoff, TokenBucket
+
+from .utils import FakeClock
+
+
+class TestTokenBucket(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.bucket = TokenBucket(rate=2, burst=3, clock=self.clock)
+
+    def test_allows_burst_then_throttles(self):
+        for _ in range(3):
+            self.assertTrue(self.bucket.consume())
+
+        self.assertFalse(self.bucket.consume())
+        self.assertAlmostEqual(0.5, self.bucket.get_wait_seconds())
+
+    def test_refills_at_rate(self):
+        for _ in range(3):
+            self.bucket.consume()
+
+        self.clock.now += 1
+
+        self.assertTrue(self.bucket.consume())
+        self.assertTrue(self.bucket.consume())
+        self.assertFalse(self.bucket.consume())
+
+    def test_zero_rate_is_unthrottled(self):
+        self.bucket.set_rate(0)
+
+        for _ in range(100):
+            self.assertTrue(self.bucket.consume())
+        self.assertEqual(0, self.bucket.get_wait_seconds())
+
+    def test_negative_rate_is_refused(self):
+        with self.assertRaises(ValueError):
+            self.bucket.set_rate(-1)
+        with self.assertRaises(ValueError):
+            TokenBucket(rate=float('nan'), burst=3)
+
+        self.assertEqual(2, self.bucket.rate)
+
+
+class TestBackoff(TestCase):
+    def test_delays_double_up_to_maximum(self):
+        backoff = Backoff(initial=1, maximum=5, random=lambda: 0)
+
+        self.assertEqual(
+            [1, 2, 4, 5, 5],
+            [backoff.get_delay() for _ in range(5)]
+        )
+        backoff.reset()
+        self.assertEqual(1, backoff.get_delay())
+
+    def test_jitter_shortens_delays(self):
+        backoff = Backoff(initial=4, jitter=0.25, random=lambda: 1)
+
+        self.assertEqual(3, backoff.get_delay())
@@ -0,0 +1,33 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mock import patch
+
+from ircpdb.utils import write_atomically
+
+
+class TestWriteAtomically(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'state.json')
+
+    def test_replaces_file(self):
+        self.assertTrue(write_atomically(self.path, 'old'))
+        self.assertTrue(write_atomically(self.path, 'new'))
+
+        with open(self.path) as in_:
+            self.assertEqual('new', in_.read())
+        self.assertEqual(['state.json'], os.listdir(self.directory))
+
+    def test_temporary_file_is_removed_on_failure(self):
+        write_atomically(self.path, 'old')
+
+        with patch('os.rename', side_effect=OSError('No space left')):
+            self.assertFalse(write_atomically(self.path, 'new'))
+
+        with open(self.path) as in_:
+            self.assertEqual('old', in_.read())
+        self.assertEqual(['state.json'], os.listdir(self.directory))